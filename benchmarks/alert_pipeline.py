@@ -0,0 +1,279 @@
+"""
+Load test for the alert pipeline.
+
+Starts the app in-process, connects N websocket clients at random Santa Clara locations,
+bulk-inserts M fires with generate_fire_schema and times check_fires() against them.
+Results (tick durations, alert latency percentiles, peak memory, event loop lag) are printed as JSON.
+
+    python -m benchmarks.alert_pipeline --clients 500 --fires 200 --ticks 5 --out results.json
+    python -m benchmarks.alert_pipeline --format msgpack --delta   # compare bytes_received
+
+Fires are written to the active database (TEST_DB_URL when ENV=test) and removed afterwards unless --keep.
+Clients share the server's event loop, so absolute numbers include their cost; compare runs against each other.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import resource
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+
+import msgpack
+import uvicorn
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from websockets.asyncio.client import connect
+
+from utils.log import setup_logging
+# keep stdout for the results (must run before main sets logging up)
+setup_logging(stream=sys.stderr)
+
+from main import app
+from db import FireModel, active_async_session
+from router.test_api import generate_fire_schema
+from router.websocket import check_fires, manager
+
+# santa clara county (same bounds as router/test_api.py)
+MIN_LAT, MAX_LAT = 36.97, 37.47
+MIN_LON, MAX_LON = -122.17, -121.25
+
+# how long a tick's alerts may keep arriving after the last one before the tick counts as delivered
+SETTLE_SECONDS = 1.0
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "p50": pick(50),
+        "p90": pick(90),
+        "p99": pick(99),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoopLagMonitor:
+    """Samples how late a short sleep wakes up; the overshoot is time the loop spent blocked."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval) * 1000)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+
+class Client:
+    def __init__(self, id: str, latitude: float, longitude: float, radius: float, format: str = "json", delta: bool = False):
+        self.id = id
+        self.location = {"latitude": latitude, "longitude": longitude, "radius": radius}
+        self.format = format
+        self.delta = delta
+        # perf_counter() of every fire_alert received
+        self.alerts: list[float] = []
+        self.fires_received = 0
+        # payload bytes (before permessage-deflate)
+        self.bytes_received = 0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self, url: str, connected: asyncio.Event):
+        query = f"id={self.id}&format={self.format}&delta={int(self.delta)}"
+        async with connect(f"{url}?{query}", max_size=None) as websocket:
+            await websocket.send(json.dumps(self.location))
+            connected.set()
+            async for raw in websocket:
+                self.bytes_received += len(raw)
+                message = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+                if message.get("type") == "fire_alert":
+                    self.alerts.append(time.perf_counter())
+                    self.fires_received += len(message.get("fires", []))
+                    if self.delta:
+                        await websocket.send(json.dumps({"type": "ack", "fires": {fire["id"]: fire["v"] for fire in message["fires"]}}))
+
+    async def start(self, url: str):
+        connected = asyncio.Event()
+        self._task = asyncio.create_task(self._run(url, connected))
+        done, _ = await asyncio.wait({self._task, asyncio.create_task(connected.wait())}, return_when=asyncio.FIRST_COMPLETED)
+        if self._task in done:
+            self._task.result() # raise the connect error
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await self._task
+
+
+async def insert_fires(count: int) -> tuple[list[str], float]:
+    rows = [
+        generate_fire_schema(
+            latitude=round(random.uniform(MIN_LAT, MAX_LAT), 6),
+            longitude=round(random.uniform(MIN_LON, MAX_LON), 6),
+        ).model_dump()
+        for _ in range(count)
+    ]
+    for row in rows:
+        # stamp with the real clock so the tracker's watermarks pick them up
+        row["updated_datetime"] = row["inserted_at"] = datetime.now(timezone.utc)
+
+    start = time.perf_counter()
+    async with active_async_session() as db:
+        for offset in range(0, len(rows), 1000):
+            await db.execute(insert(FireModel).values(rows[offset:offset + 1000]))
+        await db.commit()
+    return [row["id"] for row in rows], time.perf_counter() - start
+
+
+async def delete_fires(ids: list[str]):
+    async with active_async_session() as db:
+        await db.execute(delete(FireModel).where(FireModel.id.in_(ids)))
+        await db.commit()
+
+
+async def timed_tick(clients: list[Client]) -> dict:
+    """Run one check_fires() and wait for its alerts to arrive."""
+    received_before = {client.id: len(client.alerts) for client in clients}
+    start = time.perf_counter()
+    await check_fires()
+    tick_ms = (time.perf_counter() - start) * 1000
+
+    # wait until no client has received anything new for SETTLE_SECONDS
+    total = sum(len(client.alerts) for client in clients)
+    while True:
+        await asyncio.sleep(SETTLE_SECONDS)
+        now_total = sum(len(client.alerts) for client in clients)
+        if now_total == total:
+            break
+        total = now_total
+
+    latencies = [
+        (received - start) * 1000
+        for client in clients
+        for received in client.alerts[received_before[client.id]:]
+    ]
+    return {
+        "tick_ms": tick_ms,
+        "alerts": len(latencies),
+        "clients_alerted": sum(1 for client in clients if len(client.alerts) > received_before[client.id]),
+        "alert_latency_ms": percentiles(latencies),
+    }
+
+
+async def run(args) -> dict:
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws="websockets"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    lag = LoopLagMonitor()
+    lag.start()
+    url = f"ws://127.0.0.1:{port}/ws/alert"
+    clients = [
+        Client(
+            id=f"bench-{i}",
+            latitude=random.uniform(MIN_LAT, MAX_LAT),
+            longitude=random.uniform(MIN_LON, MAX_LON),
+            radius=args.radius,
+            format=args.format,
+            delta=args.delta,
+        )
+        for i in range(args.clients)
+    ]
+    fire_ids: list[str] = []
+    results: dict = {"config": vars(args)}
+
+    try:
+        start = time.perf_counter()
+        limit = asyncio.Semaphore(args.connect_concurrency)
+
+        async def start_client(client: Client):
+            async with limit:
+                await client.start(url)
+
+        await asyncio.gather(*(start_client(client) for client in clients))
+        results["connect_s"] = time.perf_counter() - start
+        results["connected"] = len(manager.active_connections)
+
+        # first tick indexes the new clients against whatever fires already exist
+        results["connect_tick"] = await timed_tick(clients)
+
+        fire_ids, insert_s = await insert_fires(args.fires)
+        results["insert_s"] = insert_s
+        results["fire_tick"] = await timed_tick(clients)
+
+        # nothing changed: the steady-state cost of a tick
+        idle_ticks = [await timed_tick(clients) for _ in range(args.ticks)]
+        results["idle_tick_ms"] = percentiles([tick["tick_ms"] for tick in idle_ticks])
+        results["fires_received"] = sum(client.fires_received for client in clients)
+        results["bytes_received"] = sum(client.bytes_received for client in clients)
+    finally:
+        await lag.stop()
+        for client in clients:
+            await client.stop()
+        if fire_ids and not args.keep:
+            await delete_fires(fire_ids)
+        server.should_exit = True
+        await server_task
+
+    results["loop_lag_ms"] = percentiles(lag.samples)
+    # ru_maxrss is in KiB on linux
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark check_fires and websocket alert delivery")
+    parser.add_argument("--clients", type=int, default=200, help="simulated websocket clients")
+    parser.add_argument("--fires", type=int, default=100, help="fires to bulk insert")
+    parser.add_argument("--ticks", type=int, default=3, help="idle ticks to time after the fire tick")
+    parser.add_argument("--radius", type=float, default=5000, help="client alert radius in meters")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="clients connecting at once")
+    parser.add_argument("--format", choices=("json", "msgpack"), default="json", help="wire format clients negotiate")
+    parser.add_argument("--delta", action="store_true", help="clients ask for delta alerts and ack what they get")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for locations")
+    parser.add_argument("--keep", action="store_true", help="leave the inserted fires in the db")
+    parser.add_argument("--out", default=None, help="write the json results here instead of stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # stray prints go to stderr too
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args))
+
+    output = json.dumps(results, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
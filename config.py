@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # NOTE: if this doesn't work switch to the dotenv lib
@@ -8,6 +9,86 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     TEST_DB_URL: str
     ENV: str
+    # create missing tables/indexes on startup (migrate.py); off for instances that must come up fast,
+    # with `python migrate.py` run once per deploy instead
+    DB_SCHEMA_CHECK: bool = True
+    # optional read replica of DATABASE_URL; read-only routes and the fire check read from it when set
+    DATABASE_READ_URL: str | None = None
+
+    # connection pools (per engine): size, extra connections under load, wait for a free one,
+    # recycle age (below RDS/proxy idle timeouts) and a liveness check before each checkout
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
+    # logging: level, console (colored, for local runs) | json (one object per line, for log shipping)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: Literal["console", "json"] = "console"
+    # most DEBUG lines per call site per interval (per-connection lines would otherwise scale with clients)
+    LOG_DEBUG_LIMIT: int = 20
+    LOG_DEBUG_INTERVAL_SECONDS: float = 10
+
+    # how often check_fires runs
+    CHECK_FIRES_INTERVAL_SECONDS: float = 30
+
+    # location updates are evaluated right away, at most once per device per this window
+    LOCATION_DEBOUNCE_SECONDS: float = 1.0
+
+    # nearest evac zone exits are cached per zone version and location cell of this size (meters);
+    # a cached exit is within half a cell diagonal (~7 m at 10 m) of the exact one, see ExitCache
+    EXIT_CACHE_CELL_METERS: float = 10
+    EXIT_CACHE_MAX_ENTRIES: int = 50_000
+
+    # largest alert radius (meters) a client may ask for
+    ALERT_MAX_RADIUS_METERS: float = 100_000
+
+    # how often the fire tracker re-reads all active fires instead of only rows past its watermarks
+    # (catches updates whose feed timestamp is older than one already seen)
+    FIRE_RECONCILE_SECONDS: float = 120
+
+    # per-connection websocket send queue
+    WS_SEND_QUEUE_SIZE: int = 32
+    # what to do when a client's queue is full: drop_oldest | coalesce | disconnect (alerts are merged, never dropped)
+    WS_QUEUE_FULL_POLICY: Literal["drop_oldest", "coalesce", "disconnect"] = "drop_oldest"
+
+    # app-level heartbeats: quiet connections get {"type": "ping"} every interval; clients that have answered
+    # with {"type": "pong"} are dropped after the idle timeout without a frame, and any connection whose send
+    # is stuck past the send timeout is dropped as too slow. (websocket protocol pings are uvicorn's own,
+    # --ws-ping-interval/--ws-ping-timeout, but proxies in front of the app may answer those for a dead client)
+    WS_PING_INTERVAL_SECONDS: float = 20
+    WS_IDLE_TIMEOUT_SECONDS: float = 60
+    WS_SEND_TIMEOUT_SECONDS: float = 30
+
+    # alert dedup state: (device, fire) entries kept per process, expired when untouched for the ttl
+    ALERT_STATE_MAX_ENTRIES: int = 200_000
+    ALERT_STATE_TTL_SECONDS: float = 12 * 60 * 60
+
+    # last alerts kept per device (ring buffer) so a reconnect with ?last_seq= replays only the gap
+    ALERT_LOG_SIZE: int = 16
+    ALERT_LOG_MAX_DEVICES: int = 50_000
+    ALERT_LOG_TTL_SECONDS: float = 6 * 60 * 60
+
+    # cached bodies for the fire REST endpoints (dropped on any fire table change, ttl bounds staleness)
+    FIRE_RESPONSE_CACHE_TTL_SECONDS: float = 30
+    FIRE_RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+
+    # most rows a fire listing returns per page (clients follow the X-Next-Cursor header for more)
+    FIRE_PAGE_MAX_LIMIT: int = 1000
+
+    # push fire/evac zone changes from postgres (LISTEN/NOTIFY) instead of waiting for the next tick
+    FIRE_NOTIFY_ENABLED: bool = False
+    FIRE_NOTIFY_CHANNEL: str = "emberalert_changes"
+    # how long to gather notifications before evaluating them together (bulk writes send many at once)
+    FIRE_NOTIFY_BATCH_SECONDS: float = 0.05
+
+    # how API workers share subscribers and alerts: memory (single process) | postgres (LISTEN/NOTIFY,
+    # any number of workers/hosts on the same database, one elected worker evaluates fires)
+    BROKER: Literal["memory", "postgres"] = "memory"
+    BROKER_CHANNEL_PREFIX: str = "emberalert"
+    # advisory lock id held by the evaluating worker
+    BROKER_LEADER_LOCK_KEY: int = 0x454D4252
 
     # tells Pydantic to load the variables from a file named '.env'
     model_config = SettingsConfigDict(env_file=".env")
@@ -1,39 +1,127 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, String, Boolean, DateTime, Date, Float, Text
+from sqlalchemy import Column, String, Boolean, DateTime, Date, Float, Text, Index
 from config import settings
 from sqlalchemy.sql import func
-from utils.colors import Color
+from utils.log import get_logger
+from utils.metrics import DB_QUERY_SECONDS, DB_POOL
 
-# create db engine
-engine = create_engine(settings.DATABASE_URL)
+log = get_logger("db")
 
-# create session for db operations
-SessionLocal = sessionmaker(autoflush=False, bind=engine, autocommit=False)
+# pool settings shared by every engine
+POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
 
 # base class for declarative models
 Base = declarative_base()
 
 
-# ===== FOR TEST DB =====
-engine_test = create_engine(settings.TEST_DB_URL)
-SessionLocalTest = sessionmaker(autoflush=False, bind=engine_test, autocommit=False)
-# =======================
+def to_async_url(url: str) -> URL:
+    # same database, driven through asyncpg instead of psycopg2
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+
+    # asyncpg takes 'ssl' instead of libpq's 'sslmode'
+    if "sslmode" in async_url.query:
+        query = dict(async_url.query)
+        query["ssl"] = query.pop("sslmode")
+        async_url = async_url.set(query=query)
+    return async_url
+
+
+def to_asyncpg_dsn(url: str) -> str:
+    # plain libpq-style dsn for raw asyncpg connections (LISTEN/NOTIFY)
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def instrument_engine(sync_engine, db: str):
+    # statement timing and pool usage for /metrics
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info["query_start"].pop(), db=db)
+
+    pool = sync_engine.pool
+    DB_POOL.set_function(pool.checkedout, db=db, state="checked_out")
+    DB_POOL.set_function(pool.checkedin, db=db, state="idle")
+    DB_POOL.set_function(pool.size, db=db, state="pool_size")
+
+
+def _async_engine(url: str, db: str):
+    async_engine = create_async_engine(to_async_url(url), **POOL_OPTIONS)
+    instrument_engine(async_engine.sync_engine, db)
+    return async_engine
+
+
+def _async_sessionmaker(bind):
+    return async_sessionmaker(bind=bind, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# ===== ENGINES =====
+# created on first use (module __getattr__), so importing the app loads no db driver and opens no connection;
+# `from db import engine` still works and creates it at that point
+_ENGINES = {
+    # sync engines (migrations, seed scripts)
+    "engine": lambda: create_engine(settings.DATABASE_URL, **POOL_OPTIONS),
+    "SessionLocal": lambda: sessionmaker(autoflush=False, bind=_lazy("engine"), autocommit=False),
+    "engine_test": lambda: create_engine(settings.TEST_DB_URL, **POOL_OPTIONS),
+    "SessionLocalTest": lambda: sessionmaker(autoflush=False, bind=_lazy("engine_test"), autocommit=False),
+
+    # async engines (used by the routes + scheduler so queries don't block the event loop)
+    "async_engine": lambda: _async_engine(settings.DATABASE_URL, "main"),
+    "AsyncSessionLocal": lambda: _async_sessionmaker(_lazy("async_engine")),
+    "async_engine_test": lambda: _async_engine(settings.TEST_DB_URL, "test"),
+    "AsyncSessionLocalTest": lambda: _async_sessionmaker(_lazy("async_engine_test")),
+
+    # optional read replica of the main db (reads that can tolerate replication lag); falls back to the primary
+    "async_engine_read": lambda: _async_engine(settings.DATABASE_READ_URL, "replica") if settings.DATABASE_READ_URL else None,
+    "AsyncSessionLocalRead": lambda: (
+        _async_sessionmaker(_lazy("async_engine_read")) if settings.DATABASE_READ_URL else _lazy("AsyncSessionLocal")
+    ),
+}
+_engines_lock = threading.RLock()
+
+
+def _lazy(name: str):
+    if name in globals():
+        return globals()[name]
+    with _engines_lock:
+        if name not in globals():
+            # later lookups find the module attribute directly
+            globals()[name] = _ENGINES[name]()
+        return globals()[name]
+
+
+def __getattr__(name: str):
+    if name in _ENGINES:
+        return _lazy(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # get the active db session
 def get_active_db():
+    log.debug("Using %s database", "TEST" if settings.ENV == "test" else "MAIN")
     if settings.ENV == "test":
-        print(f"{Color.YELLOW}[INFO] Database Session: Using TEST database (settings.ENV='test'){Color.RESET}")
         yield from get_test_db()
         return
 
-    print(f"{Color.YELLOW}[INFO] Database Session: Using MAIN database (settings.ENV!='test'){Color.RESET}")
     yield from get_db()
     
 # main db session
 def get_db():
-    db = SessionLocal()
+    db = _lazy("SessionLocal")()
     try:
         yield db
     finally:
@@ -41,12 +129,60 @@ def get_db():
 
 # test db session
 def get_test_db():
-    test_db = SessionLocalTest()
+    test_db = _lazy("SessionLocalTest")()
     try:
         yield test_db
     finally:
         test_db.close()
         
+# url of the db selected by settings.ENV
+def active_database_url() -> str:
+    if settings.ENV == "test":
+        return settings.TEST_DB_URL
+    return settings.DATABASE_URL
+
+# sync engine of the db selected by settings.ENV
+def active_engine():
+    return _lazy("engine_test" if settings.ENV == "test" else "engine")
+
+# get a new async session for the active db (for code that isn't a route dependency)
+def active_async_session() -> AsyncSession:
+    if settings.ENV == "test":
+        return async_test_session()
+    return _lazy("AsyncSessionLocal")()
+
+# new async session for the test db (the test routes always use it)
+def async_test_session() -> AsyncSession:
+    return _lazy("AsyncSessionLocalTest")()
+
+# read-only session for the active db: the replica for main when one is configured (test has none)
+def active_async_read_session() -> AsyncSession:
+    if settings.ENV == "test":
+        return async_test_session()
+    return _lazy("AsyncSessionLocalRead")()
+
+# get the active async db session
+async def get_active_async_db():
+    log.debug("Using %s database", "TEST" if settings.ENV == "test" else "MAIN")
+    async with active_async_session() as db:
+        yield db
+
+# get the active read-only async db session (for GET routes; writes must use get_active_async_db)
+async def get_active_async_read_db():
+    log.debug("Using %s database (read)", "TEST" if settings.ENV == "test" else "MAIN")
+    async with active_async_read_session() as db:
+        yield db
+
+# main async db session
+async def get_async_db():
+    async with _lazy("AsyncSessionLocal")() as db:
+        yield db
+
+# test async db session
+async def get_async_test_db():
+    async with async_test_session() as test_db:
+        yield test_db
+
 # db models 
 class FireModel(Base):
     __tablename__ = "fire_data"
@@ -83,6 +219,19 @@ class FireModel(Base):
 
     inserted_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # indexes (existing dbs get them from migrate.py)
+    __table_args__ = (
+        # bounding box queries
+        Index("ix_fire_data_lat_lon", "latitude", "longitude"),
+        # county filters compare lower(county); id keeps keyset pages in index order
+        Index("ix_fire_data_lower_county_id", func.lower(county), "id"),
+        # active fire lookups/counts in check_fires
+        Index("ix_fire_data_active_id", "id", postgresql_where=is_active),
+        # check_fires watermarks
+        Index("ix_fire_data_updated_datetime", "updated_datetime"),
+        Index("ix_fire_data_inserted_at", "inserted_at"),
+    )
+
 class EvacPlaceModel(Base):
     __tablename__ = "evac_places"
 
@@ -93,6 +242,10 @@ class EvacPlaceModel(Base):
     longitude = Column(Float)
     is_active = Column(Boolean, default=True)
 
+    __table_args__ = (
+        Index("ix_evac_places_active_id", "id", postgresql_where=is_active),
+    )
+
 class EvacZoneModel(Base):
     __tablename__ = "evac_zones"
 
@@ -104,3 +257,9 @@ class EvacZoneModel(Base):
     geometry_geojson = Column(Text)
     is_active = Column(Boolean, default=True)
     updated_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # zone cache version check reads (id, updated_at) of the active zones
+        Index("ix_evac_zones_active_id_updated_at", "id", "updated_at", postgresql_where=is_active),
+    )
+
@@ -1,37 +1,77 @@
+import time
+# startup time report starts here, before the heavy imports
+_import_started = time.perf_counter()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 
 from router.server import server_api
 from router.test_api import test
 from router.utils_api import utils_api
-from router.websocket import ws, check_fires
-from db import engine_test, Base
+from router.metrics_api import metrics_api
+from router.websocket import ws, check_fires, create_fire_listener, manager
 
 from fastapi.middleware.cors import CORSMiddleware
 from os import getenv
-from db import engine, engine_test, Base
+import db
+from config import settings
+from migrate import migrate
+from utils.log import setup_logging, get_logger
+from utils.metrics import MetricsMiddleware, TICK_OVERRUNS, STARTUP_SECONDS
+
+setup_logging()
+log = get_logger("main")
 
 scheduler = AsyncIOScheduler()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scheduler.add_job(check_fires, 'interval', seconds=30)
+    lifespan_started = time.perf_counter()
+    scheduler.add_job(check_fires, 'interval', seconds=settings.CHECK_FIRES_INTERVAL_SECONDS)
+    # a tick still running when the next one is due gets skipped
+    scheduler.add_listener(lambda event: TICK_OVERRUNS.inc(), EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
     scheduler.start()
 
-    # make sure main DB tables exist
-    Base.metadata.create_all(bind=engine)
+    # make sure main DB tables, indexes and notify triggers exist (skipped when DB_SCHEMA_CHECK is off)
+    if settings.DB_SCHEMA_CHECK:
+        migrate(db.engine)
+
+        # optional: initialize test DB only when ENV=test
+        if getenv("ENV") == "test":
+            try:
+                migrate(db.engine_test)
+            except Exception as e:
+                log.warning("Test DB init skipped: %s", e)
 
-    # optional: initialize test DB only when ENV=test
-    if getenv("ENV") == "test":
-        try:
-            Base.metadata.create_all(bind=engine_test)
-        except Exception as e:
-            print("Test DB init skipped:", e)
+    # share subscribers/alerts with the other workers and elect the one that evaluates fires
+    await manager.start_broker()
+    # heartbeats and reaping of dead or stuck connections
+    manager.start_reaper()
+
+    # optional: push fire changes from postgres; the interval job above stays as the safety net
+    fire_listener = None
+    if settings.FIRE_NOTIFY_ENABLED:
+        fire_listener = create_fire_listener()
+        fire_listener.start()
+
+    import_seconds = _imported - _import_started
+    lifespan_seconds = time.perf_counter() - lifespan_started
+    STARTUP_SECONDS.set(import_seconds, phase="imports")
+    STARTUP_SECONDS.set(lifespan_seconds, phase="lifespan")
+    log.info("Startup complete", extra={
+        "imports_ms": round(import_seconds * 1000, 1),
+        "lifespan_ms": round(lifespan_seconds * 1000, 1),
+        "schema_check": settings.DB_SCHEMA_CHECK,
+    })
     yield
 
-Base.metadata.create_all(bind=engine_test)
+    if fire_listener is not None:
+        await fire_listener.stop()
+    await manager.stop_reaper()
+    await manager.stop_broker()
 
 # load any .env variables
 load_dotenv()
@@ -45,10 +85,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let browser clients read the cache validators and pagination cursor
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # include routers
 app.include_router(server_api, prefix="/server", tags=["Server API"])
 app.include_router(test, prefix="/test", tags=["Test API"])
 app.include_router(ws, prefix="/ws", tags=["WebSocket"])
-app.include_router(utils_api, prefix="/utils", tags=["Utils API"])
\ No newline at end of file
+app.include_router(utils_api, prefix="/utils", tags=["Utils API"])
+app.include_router(metrics_api, tags=["Metrics"])
+
+_imported = time.perf_counter()
\ No newline at end of file
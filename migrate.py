@@ -0,0 +1,46 @@
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from config import settings
+from db import Base, active_engine
+from utils.log import get_logger, setup_logging
+from utils.pg_notify import install_notify_triggers
+
+log = get_logger("migrate")
+
+
+def ensure_indexes(bind: Engine) -> list[str]:
+    """
+    Create the indexes declared on the models that the db doesn't have yet.
+    create_all() only builds indexes together with new tables, so dbs created before an
+    index was declared need this. Safe to run on every startup.
+    """
+    created = []
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index.create(bind=conn)
+                created.append(index.name)
+    return created
+
+
+def migrate(bind: Engine):
+    Base.metadata.create_all(bind=bind)
+    created = ensure_indexes(bind)
+    if created:
+        log.info("Created indexes %s", ", ".join(created))
+    else:
+        log.info("Schema up to date")
+    # row triggers that push fire/zone changes to the workers' listeners
+    if settings.FIRE_NOTIFY_ENABLED:
+        install_notify_triggers(bind, settings.FIRE_NOTIFY_CHANNEL)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    migrate(active_engine())
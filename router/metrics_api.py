@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+from utils.metrics import REGISTRY, CONTENT_TYPE
+
+
+# define new router
+metrics_api = APIRouter()
+
+@metrics_api.get("/metrics")
+async def metrics():
+    # prometheus scrape endpoint
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -1,18 +1,20 @@
-from fastapi import APIRouter, HTTPException, status, Query, Depends
-import httpx, json
+from fastapi import APIRouter, HTTPException, status, Query, Depends, Request, Response
+from pydantic import TypeAdapter
+import httpx, json, base64, binascii
 
 from schema.fireschema import FireSchema
-from db import get_db, get_active_db, FireModel, EvacPlaceModel
-from sqlalchemy.orm import Session
+from db import get_active_async_read_db, active_async_read_session, FireModel, EvacPlaceModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, select
 from config import settings
 
 from datetime import datetime, date, timedelta
-from faker import Faker
-import random
-fake = Faker()
 from schema.resourceplaceschema import ResourcePlaceSchema
+from utils.response_cache import fire_response_cache, conditional_response
+from utils.streaming import wants_ndjson, ndjson_response
+from utils.evac_zones import zone_cache
+from utils.geo import haversine_km
 
 
 # define new router
@@ -20,19 +22,68 @@ server_api = APIRouter()
 
 VALID_COUNTY = ["Santa Clara", "Santa Clara County", "County of Santa Clara", "SCC", "SCL"]
 
+fire_adapter = TypeAdapter(FireSchema)
+fire_list_adapter = TypeAdapter(list[FireSchema])
+resource_adapter = TypeAdapter(ResourcePlaceSchema)
+
+
+# keyset pagination: pages are ordered by id and the cursor is the last id of the previous page
+def _encode_cursor(fire_id: str) -> str:
+    return base64.urlsafe_b64encode(fire_id.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+async def _fetch_page(db: AsyncSession, q, limit: int, cursor: str | None) -> tuple[list[FireModel], dict[str, str]]:
+    q = q.order_by(FireModel.id)
+    if cursor:
+        q = q.where(FireModel.id > _decode_cursor(cursor))
+
+    # one extra row tells us whether there's another page
+    result = await db.execute(q.limit(limit + 1))
+    fires = result.scalars().all()
+    if len(fires) > limit:
+        return fires[:limit], {"X-Next-Cursor": _encode_cursor(fires[limit - 1].id)}
+    return fires, {}
+
 
 # get all fires in Santa Clara County 
 @server_api.get("/fires", response_model=list[FireSchema])
-async def get_fires(county: str, db: Session = Depends(get_active_db)) -> list[FireSchema]:
+async def get_fires(
+    request: Request,
+    county: str,
+    limit: int = Query(settings.FIRE_PAGE_MAX_LIMIT, ge=1, le=settings.FIRE_PAGE_MAX_LIMIT),
+    cursor: str | None = Query(None),
+    stream: bool = Query(False),
+    db: AsyncSession = Depends(get_active_async_read_db),
+) -> Response:
     if county.lower() not in map(str.lower, VALID_COUNTY):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not a valid county in query")
 
+    q = select(FireModel).where(func.lower(FireModel.county) == county.lower())
+
+    # streamed listings (stream=true or Accept: application/x-ndjson) skip paging and the response cache
+    if wants_ndjson(request, stream):
+        return await ndjson_response(q.order_by(FireModel.id), fire_adapter, active_async_read_session)
+
+    # repeated polls are answered from the cache (the session never touches the db)
+    key = fire_response_cache.key(request)
+    cached = fire_response_cache.get(key)
+    if cached:
+        return conditional_response(request, cached)
+
     try:
-        fires = db.query(FireModel).filter(FireModel.county == county).all()
+        fires, headers = await _fetch_page(db, q, limit, cursor)
 
-        if not fires:
+        # an empty page past the end isn't an error, only an empty first page is
+        if not fires and not cursor:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No fires present.")
-        return fires
+
+        body = fire_list_adapter.dump_json(fire_list_adapter.validate_python(fires, from_attributes=True))
+        return conditional_response(request, fire_response_cache.put(key, body, headers=headers))
         
     except OperationalError:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to the database.")
@@ -46,17 +97,23 @@ async def get_fires(county: str, db: Session = Depends(get_active_db)) -> list[F
 
 # get info for a specific fire based on a fire's id
 @server_api.get("/fire-data/{fire_id}", response_model=FireSchema)
-async def get_fire_data(fire_id: str, db: Session = Depends(get_active_db)) -> FireSchema:
+async def get_fire_data(request: Request, fire_id: str, db: AsyncSession = Depends(get_active_async_read_db)) -> Response:
     if not fire_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No fire id provided")
-    
+
+    key = fire_response_cache.key(request)
+    cached = fire_response_cache.get(key)
+    if cached:
+        return conditional_response(request, cached)
+
     try:
-        fire_data = db.query(FireModel).filter(FireModel.id == fire_id).first()
+        fire_data = await db.get(FireModel, fire_id)
 
         if not fire_data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Fire (ID: {fire_id}) does not exist")
 
-        return fire_data
+        body = fire_adapter.dump_json(fire_adapter.validate_python(fire_data, from_attributes=True))
+        return conditional_response(request, fire_response_cache.put(key, body, fire_data.updated_datetime))
     except OperationalError:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to the database.")
     
@@ -68,31 +125,46 @@ async def get_fire_data(fire_id: str, db: Session = Depends(get_active_db)) -> F
     
 @server_api.get("/fires/box", response_model=list[FireSchema])
 async def get_fires_in_box(
+    request: Request,
     minLat: float = Query(...),
     minLng: float = Query(...),
     maxLat: float = Query(...),
     maxLng: float = Query(...),
     county: str | None = Query(None),
-    db: Session = Depends(get_active_db),
-) -> list[FireSchema]:
+    limit: int = Query(settings.FIRE_PAGE_MAX_LIMIT, ge=1, le=settings.FIRE_PAGE_MAX_LIMIT),
+    cursor: str | None = Query(None),
+    stream: bool = Query(False),
+    db: AsyncSession = Depends(get_active_async_read_db),
+) -> Response:
     if minLat > maxLat:
         minLat, maxLat = maxLat, minLat
     if minLng > maxLng:
         minLng, maxLng = maxLng, minLng
 
-    try:
-        q = db.query(FireModel).filter(
-            and_(
-                FireModel.latitude  >= minLat,
-                FireModel.latitude  <= maxLat,
-                FireModel.longitude >= minLng,
-                FireModel.longitude <= maxLng,
-            )
+    q = select(FireModel).where(
+        and_(
+            FireModel.latitude  >= minLat,
+            FireModel.latitude  <= maxLat,
+            FireModel.longitude >= minLng,
+            FireModel.longitude <= maxLng,
         )
-        if county:
-            q = q.filter(func.lower(FireModel.county) == county.lower())
+    )
+    if county:
+        q = q.where(func.lower(FireModel.county) == county.lower())
+
+    if wants_ndjson(request, stream):
+        return await ndjson_response(q.order_by(FireModel.id), fire_adapter, active_async_read_session)
 
-        return q.all() 
+    key = fire_response_cache.key(request)
+    cached = fire_response_cache.get(key)
+    if cached:
+        return conditional_response(request, cached)
+
+    try:
+        fires, headers = await _fetch_page(db, q, limit, cursor)
+
+        body = fire_list_adapter.dump_json(fire_list_adapter.validate_python(fires, from_attributes=True))
+        return conditional_response(request, fire_response_cache.put(key, body, headers=headers))
     except OperationalError:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="DB unavailable")
     except IntegrityError:
@@ -106,18 +178,19 @@ def ping():
     return {"ok": True}
 
 @server_api.get("/resources", response_model=list[ResourcePlaceSchema])
-async def list_resources(db: Session = Depends(get_active_db)):
+async def list_resources(request: Request, stream: bool = Query(False), db: AsyncSession = Depends(get_active_async_read_db)):
     """
     List community resources (shelters, food, services) from evac_places table.
     These are for the Resources page, not used for redirect logic.
+    Send stream=true or Accept: application/x-ndjson to get one resource per line instead of a JSON list.
     """
+    q = select(EvacPlaceModel).where(EvacPlaceModel.is_active == True)
+    if wants_ndjson(request, stream):
+        return await ndjson_response(q.order_by(EvacPlaceModel.id), resource_adapter, active_async_read_session)
+
     try:
-        places = (
-            db.query(EvacPlaceModel)
-            .filter(EvacPlaceModel.is_active == True)
-            .all()
-        )
-        return places
+        result = await db.execute(q)
+        return result.scalars().all()
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -132,9 +205,40 @@ async def list_resources(db: Session = Depends(get_active_db)):
 from db import EvacZoneModel
 
 @server_api.get("/evac-zones")
-async def list_evac_zones(db: Session = Depends(get_active_db)):
-    zones = db.query(EvacZoneModel).all()
+async def list_evac_zones(db: AsyncSession = Depends(get_active_async_read_db)):
+    result = await db.execute(select(EvacZoneModel))
+    zones = result.scalars().all()
     return [
         {"id": z.id, "name": z.name, "county": z.county, "status": z.status}
         for z in zones
     ]
+
+
+@server_api.get("/evac-exit")
+async def get_evac_exit(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    db: AsyncSession = Depends(get_active_async_read_db),
+):
+    """
+    Nearest exit out of the evac zone(s) containing a location, for the evacuation screen.
+    Same zone cache and per-cell exit cache as the websocket alerts.
+    """
+    try:
+        await zone_cache.refresh(db)
+    except OperationalError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to the database.")
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected database error occurred.")
+
+    zone, exit_lat, exit_lng = zone_cache.nearest_exit(user_lat=lat, user_lon=lng)
+    if zone is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Location is not inside an active evac zone")
+
+    return {
+        "zone_id": zone.id,
+        "zone_name": zone.name,
+        "exit_latitude": exit_lat,
+        "exit_longitude": exit_lng,
+        "distance_m": round(float(haversine_km(lat, lng, exit_lat, exit_lng)) * 1000, 1),
+    }
@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from db import get_test_db, FireModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_test_db, async_test_session, FireModel
 
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 from schema.fireschema import FireSchema 
-from faker import Faker
+from utils.response_cache import fire_response_cache
+from utils.streaming import wants_ndjson, ndjson_response
+from pydantic import TypeAdapter
 from datetime import datetime, timedelta
+from functools import lru_cache
 import random
 
-fake = Faker()
-
 test = APIRouter()
 
 # Min Latitude: 36.97
@@ -34,7 +36,15 @@ class FireCoordinatesRequest(BaseModel):
 
 
 
+@lru_cache(maxsize=1)
+def get_faker():
+    # faker is slow to import and only the test endpoints need it
+    from faker import Faker
+    return Faker()
+
+
 def generate_fire_schema(latitude: float, longitude: float) -> FireSchema:
+    fake = get_faker()
     start_time = fake.date_time_this_year()
     extinguish_time = None
 
@@ -61,19 +71,20 @@ def generate_fire_schema(latitude: float, longitude: float) -> FireSchema:
 
 
 @test.post("/fire-w-coords", response_model=FireSchema)
-async def post_fire_w_coords(request: FireCoordinatesRequest, db: Session = Depends(get_test_db)) -> FireSchema:
+async def post_fire_w_coords(request: FireCoordinatesRequest, db: AsyncSession = Depends(get_async_test_db)) -> FireSchema:
     new_fire = generate_fire_schema(latitude=request.latitude, longitude=request.longitude)
 
     db_record = FireModel(**new_fire.model_dump())
     db.add(db_record)
-    db.commit()
-    db.refresh(db_record)
+    await db.commit()
+    await db.refresh(db_record)
+    fire_response_cache.invalidate()
     
     return db_record
 
 
 @test.post("/fire", response_model=FireSchema)
-async def post_fire(db: Session = Depends(get_test_db)) -> FireSchema:
+async def post_fire(db: AsyncSession = Depends(get_async_test_db)) -> FireSchema:
     new_fire = generate_fire_schema(
         latitude=round(random.uniform(36.97, 37.47), 6),
         longitude=round(random.uniform(-122.17, -121.25), 6)
@@ -81,15 +92,16 @@ async def post_fire(db: Session = Depends(get_test_db)) -> FireSchema:
     
     db_record = FireModel(**new_fire.model_dump())
     db.add(db_record)
-    db.commit()
-    db.refresh(db_record)
+    await db.commit()
+    await db.refresh(db_record)
+    fire_response_cache.invalidate()
     
     return db_record
 
 @test.delete("/fire/{fire_id}")
-async def delete_fire(fire_id: str, db: Session = Depends(get_test_db)):
+async def delete_fire(fire_id: str, db: AsyncSession = Depends(get_async_test_db)):
     try:
-        fire = db.query(FireModel).filter(FireModel.id == fire_id).first()
+        fire = await db.get(FireModel, fire_id)
 
         if not fire:
             raise HTTPException(
@@ -97,8 +109,9 @@ async def delete_fire(fire_id: str, db: Session = Depends(get_test_db)):
                 detail=f"Fire with id '{fire_id}' not found."
             )
 
-        db.delete(fire)
-        db.commit()
+        await db.delete(fire)
+        await db.commit()
+        fire_response_cache.invalidate()
 
         return {"message": f"Fire '{fire_id}' successfully deleted."}
 
@@ -121,9 +134,13 @@ async def delete_fire(fire_id: str, db: Session = Depends(get_test_db)):
         )
         
 @test.get("/fires", response_model=list[FireSchema])
-async def get_all_fires(db: Session = Depends(get_test_db)) -> list[FireSchema]:
+async def get_all_fires(request: Request, stream: bool = Query(False), db: AsyncSession = Depends(get_async_test_db)) -> list[FireSchema]:
+    if wants_ndjson(request, stream):
+        return await ndjson_response(select(FireModel).order_by(FireModel.id), TypeAdapter(FireSchema), async_test_session)
+
     try:
-        fires = db.query(FireModel).all()
+        result = await db.execute(select(FireModel))
+        fires = result.scalars().all()
 
         if not fires:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No fires present.")
@@ -1,24 +1,58 @@
-from fastapi import WebSocket, APIRouter, WebSocketDisconnect, Depends, status
-from sqlalchemy.orm import Session
-from datetime import timedelta, datetime
-from shapely.geometry import shape, Point
-from shapely.ops import nearest_points
+from fastapi import WebSocket, APIRouter, WebSocketDisconnect, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import math
+import time
+import json
+import asyncio
+import contextlib
+import numpy as np
 from typing import Sequence
 
-from db import get_db, get_test_db, get_active_db, FireModel, SessionLocal, SessionLocalTest, EvacZoneModel
+from db import active_async_session, active_async_read_session, active_database_url, to_asyncpg_dsn, FireModel
 from schema.fireschema import FireSchema
 from schema.userlocation import UserLocation
-from utils.geo import get_coordinates
 from utils.ws_manager import ConnectionManager
+from utils.evac_zones import zone_cache
+from utils.fire_tracker import FireTracker
+from utils.pg_notify import PgListener
+from utils.broker import Broker, InMemoryBroker, PostgresBroker
+from utils.alert_state import alert_version
+from utils.alert_payload import FireFragments, FireAlertMessage
+from utils.wire import WireProtocol, receive_message
+from utils.geo import haversine_km, haversine_km_matrix
+from utils.response_cache import fire_response_cache
+from utils.metrics import TICK_SECONDS, TICK_OVERRUNS, ACTIVE_FIRES, WS_CONNECTIONS, ALERTS_SENT, EVAC_ZONE_LOOKUP_SECONDS
 from config import settings
-from utils.colors import Color
-import json
+from utils.log import get_logger
 
 ws = APIRouter()
+log = get_logger("ws")
+tick_log = get_logger("check_fires")
+
+
+def create_broker() -> Broker:
+    if settings.BROKER == "postgres":
+        return PostgresBroker(
+            dsn=to_asyncpg_dsn(active_database_url()),
+            prefix=settings.BROKER_CHANNEL_PREFIX,
+            lock_key=settings.BROKER_LEADER_LOCK_KEY,
+        )
+    return InMemoryBroker()
 
-manager = ConnectionManager()
-cache: dict[str, set[str]] = {}
+
+manager = ConnectionManager(broker=create_broker())
+fire_tracker = FireTracker()
+# serializes the interval tick and NOTIFY-driven evaluations, which share the tracker and dedup cache
+evaluation_lock = asyncio.Lock()
+_pending_fire_ids: set[str] = set()
+_notify_task: asyncio.Task | None = None
+_pending_location_ids: set[str] = set()
+_location_task: asyncio.Task | None = None
+
+ACTIVE_FIRES.set_function(lambda: len(fire_tracker))
+WS_CONNECTIONS.set_function(lambda: len(manager.active_connections), scope="local")
+WS_CONNECTIONS.set_function(lambda: len(manager.remote), scope="remote")
 
 FALLBACK_SAFE_PLACES = [
     {
@@ -88,42 +122,73 @@ async def alert(websocket: WebSocket):
     await websocket.accept()
     # check id from query parameters
     id = websocket.query_params.get("id")
+    if not id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
 
     try:
-        if not id:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        # intial connection (json text, or msgpack binary)
+        try:
+            data = await receive_message(websocket)
+            log.debug("Data received: %s", data, extra={"device": id})
+            location = UserLocation(**data)
+
+            # a reconnecting client sends the last alert seq it saw and gets only what it missed
+            last_seq = data.get("last_seq", websocket.query_params.get("last_seq"))
+            last_seq = int(last_seq) if last_seq is not None else None
+        except (ValueError, TypeError) as e:
+            log.warning("Invalid location data - %s", e, extra={"device": id})
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Invalid location data format")
+            return
+
+        # wire format and delta mode, from the query string or a "protocol" object in this first message
+        try:
+            protocol, requested = WireProtocol.negotiate(websocket, data)
+        except ValueError as e:
+            log.warning("Unsupported protocol - %s", e, extra={"device": id})
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason=str(e))
             return
-        # intial connection
-        data = await websocket.receive_json()
-        print(f"{Color.YELLOW}[INFO] WS: Data recieved: {data}{Color.RESET}")
-        location = UserLocation(**data)
 
         # store the connection
-        await manager.add_connection(websocket=websocket, id=id, user_location=location)
-        print(f"{Color.YELLOW}[INFO] WS: Connected device [ID] - {id}{Color.RESET}", flush=True)
+        await manager.add_connection(websocket=websocket, id=id, user_location=location, protocol=protocol, last_seq=last_seq)
+        if requested:
+            await manager.send_json_message(id, protocol.describe())
+        log.info("Connected", extra={"device": id, "format": protocol.format, "delta": protocol.delta})
 
         # loop over the ongoing messages
         while True:
-            data = await websocket.receive_json()
+            try:
+                data = await receive_message(websocket)
+                manager.touch(id, pong=data.get("type") == "pong")
+
+                # client pushes updated location to the server
+                if data.get("type") == "update_location":
+                    log.debug("Updated location", extra={"device": id})
+                    new_location = UserLocation(**data)
+                    await manager.update_location(id=id, user_location=new_location)
 
-            # client pushes updated location to the server
-            if data.get("type") == "update_location":
-                print(f"{Color.YELLOW}[INFO] WS: Updated location for device - ID[{id}]{Color.RESET}", flush=True)
-                new_location = UserLocation(**data)
-                await manager.update_location(id=id, user_location=new_location)
+                # delta clients confirm the fire versions they stored
+                elif data.get("type") == "ack":
+                    manager.ack(id, data.get("fires") or {})
+
+                # clients can check the connection from their side too
+                elif data.get("type") == "ping":
+                    await manager.send_json_message(id, {"type": "pong"})
+
+            except (ValueError, TypeError) as e:
+                # one bad message doesn't end the connection
+                log.warning("Invalid location data - %s", e, extra={"device": id})
+                await manager.send_json_message(id, "Invalid location data format")
 
     except WebSocketDisconnect:
-        # await manager.disconnect(id=id)
-        print(f"{Color.YELLOW}[INFO] WSDisconnect: Disconnect websocket - [ID: {id}]{Color.RESET}", flush=True)
-        await manager.disconnect(id=id)
-        return
-    except (ValueError, TypeError) as e: 
-        print(f"{Color.RED}[ERROR]: An error occurred: {e}{Color.RESET}")
-        await manager.send_json_message(id, "Invalid location data format")
+        log.debug("Websocket closed by client", extra={"device": id})
     except Exception as e:
-        print(f"{Color.RED}[ERROR]: Unexpected error occurred with device ID[{id}]: {e}{Color.RESET}", flush=True)
-        return
-        # await manager.disconnect(id=id)
+        log.error("Unexpected error - %s: %s", type(e).__name__, e, extra={"device": id})
+        with contextlib.suppress(Exception):
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        # every way out removes the connection (a no-op if a reconnect already replaced this socket)
+        await manager.disconnect(id=id, websocket=websocket)
 
 
 
@@ -141,7 +206,7 @@ def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
 def get_nearest_fallback_place(
     user_lat: float,
     user_lon: float,
-    active_fires: Sequence[FireModel] | None = None,
+    active_fires: Sequence[FireSchema] | None = None,
     fire_exclusion_km: float = 2.0,
 ):
     if not FALLBACK_SAFE_PLACES:
@@ -181,155 +246,322 @@ def get_nearest_fallback_place(
     return best, best_lat, best_lon
 
 
-
-def get_nearest_exit_from_evac_zone(db: Session, user_lat: float, user_lon: float):
-    user_point = Point(user_lon, user_lat)
-    zones = db.query(EvacZoneModel).filter(EvacZoneModel.is_active == True).all()
-    if not zones:
+def get_nearest_fallback_places(
+    user_lats: Sequence[float],
+    user_lons: Sequence[float],
+    active_fires: Sequence[FireSchema] | None = None,
+    fire_exclusion_km: float = 2.0,
+) -> list[tuple]:
+    """Vectorized get_nearest_fallback_place: one (place, lat, lon) result per user, same fires for all."""
+    no_place = (None, None, None)
+    places = [place for place in FALLBACK_SAFE_PLACES if place.get("lat") is not None and place.get("lon") is not None]
+    if not places or not len(user_lats):
+        return [no_place] * len(user_lats)
+
+    place_lats = [place["lat"] for place in places]
+    place_lons = [place["lon"] for place in places]
+
+    # ignore fallback places that are too close to a fire, for everyone at once
+    usable = np.ones(len(places), dtype=bool)
+    burning = [fire for fire in active_fires or () if fire.is_active]
+    if burning:
+        fire_dist_km = haversine_km_matrix(
+            place_lats, place_lons,
+            [fire.latitude for fire in burning], [fire.longitude for fire in burning],
+        )
+        usable = ~(fire_dist_km <= fire_exclusion_km).any(axis=1)
+    if not usable.any():
+        return [no_place] * len(user_lats)
+
+    dist_km = haversine_km_matrix(user_lats, user_lons, place_lats, place_lons)
+    dist_km[:, ~usable] = np.inf
+    return [(places[i], places[i]["lat"], places[i]["lon"]) for i in dist_km.argmin(axis=1).tolist()]
+
+
+
+def get_nearest_exit_from_evac_zone(user_lat: float, user_lon: float):
+    # zones come from the in-memory cache, refreshed once per tick by check_fires
+    with EVAC_ZONE_LOOKUP_SECONDS.time():
+        best_zone, best_exit_lat, best_exit_lon = zone_cache.nearest_exit(user_lat=user_lat, user_lon=user_lon)
+    if best_zone is None:
         return None, None, None
 
-    best_zone = None
-    best_exit_lat = None
-    best_exit_lon = None
-    best_dist = None
+    return best_zone, best_exit_lat, best_exit_lon
 
-    for zone in zones:
-        geom_json = zone.geometry_geojson
-        if not geom_json:
-            continue
 
-        try:
-            geom_dict = json.loads(geom_json)
-            zone_geom = shape(geom_dict)   # use polygon
-        except Exception:
-            continue
 
-        # find zones that contain the user loc
-        if not zone_geom.is_valid or not zone_geom.contains(user_point):
-            continue
+async def alert_user(id: str, user_location: UserLocation, fires_in_box: Sequence[FireSchema], fallback: tuple, fragments: FireFragments):
+    tick_log.debug("Checking client", extra={"device": id, "location": user_location})
 
-        # nearest point on the boundary of this polygon to user
-        boundary = zone_geom.boundary
-        _, nearest_on_boundary = nearest_points(user_point, boundary)
+    fire_alerts: list[FireSchema] = []
+    versions: dict[str, str] = {}
 
-        dist = user_point.distance(nearest_on_boundary)
+    for fire_schema in fires_in_box:
+        # skip fires the user was already alerted about, unless something material changed since
+        version = alert_version(fire_schema)
+        if not manager.alert_state.is_new(id, fire_schema.id, version):
+            continue
+        else:
+            tick_log.debug("Fire within bounds", extra={"device": id, "fire": fire_schema.id})
+            fire_alerts.append(fire_schema)
+            versions[fire_schema.id] = version
+
+    if fire_alerts:
+
+        safe_name = None
+        # get nearest exit from any evac zone the user is inside
+        zone, safe_lat, safe_lon = get_nearest_exit_from_evac_zone(
+            user_lat=user_location.latitude,
+            user_lon=user_location.longitude,
+        )
+
+        # user is not inside any evac zone fall back to nearest static safe place
+        if safe_lat is None or safe_lon is None:
+            fallback_place, fb_lat, fb_lon = fallback
+            if fallback_place and fb_lat is not None and fb_lon is not None:
+                safe_lat = fb_lat
+                safe_lon = fb_lon
+                safe_name = fallback_place.get("name") or "Nearest safe location"
+
+        # fires are encoded once per evaluation and shared across users; only the safe place is per user
+        payload = {}
+        if safe_lat is not None and safe_lon is not None:
+            payload["safe_latitude"] = safe_lat
+            payload["safe_longitude"] = safe_lon
+            if safe_name:
+                payload["safe_name"] = safe_name
+            elif zone:
+                payload["safe_name"] = f"Nearest exit from evac zone: {zone.name or zone.id}"
+            else:
+                payload["safe_name"] = "Nearest safe location"
+        else:
+            # google HQ fallback
+            payload["safe_latitude"] = 37.4220
+            payload["safe_longitude"] = -122.0841
+            payload["safe_name"] = "Google HQ (test fallback)"
+
+        # queue the alert locally (the connection's writer task does the actual send) or hand it to the subscriber's worker
+        message = FireAlertMessage({fire.id: fragments.get(fire) for fire in fire_alerts}, payload)
+        if not await manager.deliver(id, message):
+            return
+        ALERTS_SENT.inc()
+        for fire in fire_alerts:
+            manager.alert_state.record(id, fire.id, versions[fire.id])
+        tick_log.debug("Delivered fire alerts", extra={"device": id, "fires": len(fire_alerts)})
+
+
+def match_within_radius(candidates: Sequence[tuple[str, FireSchema]]) -> dict[str, dict[str, FireSchema]]:
+    """
+    Keep the (subscriber, fire) pairs whose distance is within the subscriber's radius (meters).
+    The grids only guarantee the fire is in the radius' bounding box, whose corners are ~41% farther out.
+    """
+    locations = {id: manager.location_of(id) for id, _ in candidates}
+    pairs = [(id, fire) for id, fire in candidates if locations[id] is not None]
+    matches: dict[str, dict[str, FireSchema]] = {}
+    if not pairs:
+        return matches
+
+    distance_km = haversine_km(
+        [locations[id].latitude for id, _ in pairs], [locations[id].longitude for id, _ in pairs],
+        [fire.latitude for _, fire in pairs], [fire.longitude for _, fire in pairs],
+    )
+    radius_km = np.array([locations[id].radius for id, _ in pairs]) / 1000
+    for i in np.flatnonzero(distance_km <= radius_km).tolist():
+        id, fire = pairs[i]
+        matches.setdefault(id, {})[fire.id] = fire
+    return matches
+
+
+async def alert_subscribers(db: AsyncSession | None, changed_fires: Sequence[FireSchema], moved_ids: set[str]):
+    active_fires = list(fire_tracker.active.values())
+    manager.sync_index()
+
+    # work starts from what changed, so idle subscribers cost nothing:
+    # changed fires -> the subscribers whose bounding box covers each one
+    candidates: list[tuple[str, FireSchema]] = []
+    for fire in changed_fires:
+        candidates.extend((id, fire) for id in manager.index.query_point(fire.latitude, fire.longitude))
+
+    # subscribers that connected or moved -> the active fires inside their bounding box
+    for id in moved_ids:
+        bounding_box = manager.index.boxes.get(id)
+        if bounding_box is None:
+            continue
+        candidates.extend((id, fire_tracker.active[fire_id]) for fire_id in fire_tracker.index.query_box(bounding_box))
+
+    matches = match_within_radius(candidates)
+
+    # pick up added/changed evac zones before computing exits (no-op when nothing changed);
+    # without a session the zones from the last refresh are used
+    if matches and db is not None:
+        await zone_cache.refresh(db)
+
+    # nearest static safe place for every matched user in one pass (used when they aren't inside an evac zone)
+    matched_locations = {id: manager.location_of(id) for id in matches}
+    matched_ids = [id for id, location in matched_locations.items() if location is not None]
+    matched_locations = [matched_locations[id] for id in matched_ids]
+    fallbacks = dict(zip(matched_ids, get_nearest_fallback_places(
+        user_lats=[location.latitude for location in matched_locations],
+        user_lons=[location.longitude for location in matched_locations],
+        active_fires=active_fires,
+    )))
+
+    fragments = FireFragments()
+
+    # loop over the connections that have at least one fire in bounds
+    for id in matched_ids:
+        user_location = manager.location_of(id)
+        if user_location is None: # disconnected since the index lookup
+            continue
 
-        if best_dist is None or dist < best_dist:
-            best_dist = dist
-            best_zone = zone
-            best_exit_lon = float(nearest_on_boundary.x)
-            best_exit_lat = float(nearest_on_boundary.y)
+        try:
+            await alert_user(id=id, user_location=user_location, fires_in_box=list(matches[id].values()), fallback=fallbacks[id], fragments=fragments)
+        except Exception as e:
+            # one bad client shouldn't abort the tick for everyone else; re-check it next tick
+            manager.moved.add(id)
+            tick_log.error("Failed to alert device - %s: %s", type(e).__name__, e, extra={"device": id})
 
-    if best_zone is None:
-        return None, None, None
 
-    return best_zone, best_exit_lat, best_exit_lon
+async def check_fires():
+    # the tick only reads, so it can use the replica
+    db = active_async_read_session()
+    moved_ids: set[str] = set()
+    try:
+        # with several workers only the elected one evaluates; the rest just hold sockets
+        if not await manager.broker.elect():
+            if fire_tracker.max_updated is not None:
+                # lost the lead: start from scratch if it comes back
+                fire_tracker.reset()
+            return
 
+        start = time.perf_counter()
+        async with evaluation_lock:
+            # only rows that changed since the last tick are read from the db
+            tracker_version = fire_tracker.version
+            changed_fires, removed_ids = await fire_tracker.sync(db)
+            if fire_tracker.version != tracker_version:
+                fire_response_cache.invalidate()
+            moved_ids = manager.take_moved()
+            manager.alert_state.evict_expired()
+            manager.alert_log.evict_expired()
+            await alert_subscribers(db=db, changed_fires=changed_fires, moved_ids=moved_ids)
+
+        elapsed = time.perf_counter() - start
+        tick_log.info("Tick done", extra={
+            "active_fires": len(fire_tracker),
+            "changed": len(changed_fires),
+            "removed": len(removed_ids),
+            "connections": len(manager.active_connections),
+            "remote": len(manager.remote),
+            "moved": len(moved_ids),
+            "ms": round(elapsed * 1000, 1),
+        })
+        TICK_SECONDS.observe(elapsed)
+        if elapsed > settings.CHECK_FIRES_INTERVAL_SECONDS:
+            TICK_OVERRUNS.inc()
+    except Exception as e:
+        # retry the subscribers this tick didn't get to
+        manager.moved.update(id for id in moved_ids if manager.location_of(id) is not None)
+        tick_log.exception("Tick failed - %s: %s", type(e).__name__, e)
+    finally:
+        await db.close()
 
 
-async def check_fires():
-    print(f"{Color.GREEN}[INFO] CheckFires: performing scheduled fire check at {datetime.now()}{Color.RESET}", flush=True)
-    db_gen = get_active_db()
-    db = next(db_gen)
-    id = None
+async def evaluate_fires(fire_ids: set[str]):
+    """Re-read just these fires (pushed by NOTIFY) and alert the subscribers they affect."""
+    # primary, not the replica: the notification can arrive before the replica has the row
+    db = active_async_session()
     try:
-        active_fires = db.query(FireModel).filter(FireModel.is_active == True).all()
-        print(f"[CheckFires] active_fires={len(active_fires)}", flush=True)
-        print(f"[CheckFires] active_connections={len(manager.active_connections)}", flush=True)
-
-        # loop over active connections
-        for id, user_data in manager.active_connections.items():
-            user_location = user_data["location"]
-            print(f"{Color.GREEN}[INFO] CheckFires: Check for client (id={id}) (loc={user_location}) {datetime.now()}{Color.RESET}", flush=True)
-
-            bounding_box = get_coordinates(
-                latitude=user_location.latitude,
-                longitude=user_location.longitude,
-                radius=user_location.radius
-            )
-
-            #temp debug stuff
-            print(f"[CheckFires] BBOX: "
-            f"minLat={bounding_box.min_lat}, maxLat={bounding_box.max_lat}, "
-            f"minLon={bounding_box.min_lon}, maxLon={bounding_box.max_lon}", flush=True)
-
-
-            user_cache = cache.setdefault(id, set())
-            fire_alerts: list[FireSchema] = []
-
-            # loop over the active fires 
-            if active_fires:   
-                for fire in active_fires:
-                    # check if there is a fire within the users bounding box
-                    if (
-                        bounding_box.min_lat <= fire.latitude <= bounding_box.max_lat
-                        and bounding_box.min_lon <= fire.longitude <= bounding_box.max_lon
-                    ):
-
-                        # check if the fire is already in the cache, if not add it to alerts list 
-                        fire_schema = FireSchema.model_validate(fire, from_attributes=True) 
-
-                        if fire_schema in user_cache: # if cache hit, skip over it
-                            continue
-                        else:
-                            print(f"{Color.BLUE}[FIRE W/IN BOUNDS] {fire_schema.name} is within bounds. Sending to client... {Color.RESET}", flush=True)
-                            fire_alerts.append(fire_schema) # add fire alert to cache
-
-            else: # There are NO active fires
-                print(f"{Color.GREEN}[INFO] CheckFires: No active fire incidents available in DB (time={datetime.now()}){Color.RESET}", flush=True)
-
-            if fire_alerts:
-                print(f"[CheckFires] user {id} has {len(fire_alerts)} overlapping fires", flush=True)
-
-                safe_name = None
-                # get nearest exit from any evac zone the user is inside
-                zone, safe_lat, safe_lon = get_nearest_exit_from_evac_zone(
-                    db=db,
-                    user_lat=user_location.latitude,
-                    user_lon=user_location.longitude,
-                )
-
-                # user is not inside any evac zone fall back to nearest static safe place
-                if safe_lat is None or safe_lon is None:
-                    fallback_place, fb_lat, fb_lon = get_nearest_fallback_place(
-                        user_lat=user_location.latitude,
-                        user_lon=user_location.longitude,
-                        active_fires=active_fires,
-                    )
-                    if fallback_place and fb_lat is not None and fb_lon is not None:
-                        safe_lat = fb_lat
-                        safe_lon = fb_lon
-                        safe_name = fallback_place.get("name") or "Nearest safe location"
-
-                payload = {
-                    "type": "fire_alert",
-                    "fires": [
-                        FireSchema.model_validate(fire, from_attributes=True).model_dump(mode="json")
-                        for fire in fire_alerts
-                    ],
-                }
-                if safe_lat is not None and safe_lon is not None:
-                    payload["safe_latitude"] = safe_lat
-                    payload["safe_longitude"] = safe_lon
-                    if safe_name:
-                        payload["safe_name"] = safe_name
-                    elif zone:
-                        payload["safe_name"] = f"Nearest exit from evac zone: {zone.name or zone.id}"
-                    else:
-                        payload["safe_name"] = "Nearest safe location"
-                else:
-                    # google HQ fallback
-                    payload["safe_latitude"] = 37.4220
-                    payload["safe_longitude"] = -122.0841
-                    payload["safe_name"] = "Google HQ (test fallback)"
-
-                await manager.active_connections[id]["socket"].send_json(payload)
-                user_cache.update(fire_alerts)
-                print(
-                    f"{Color.GREEN}[INFO] CheckFires: Delivered {len(fire_alerts)} fire alert(s) to device {id}{Color.RESET}",
-                    flush=True
-                )
+        async with evaluation_lock:
+            result = await db.execute(select(FireModel).where(FireModel.id.in_(fire_ids)))
+            changed_fires = []
+            seen = set()
+            for fire in result.scalars():
+                seen.add(fire.id)
+                # the interval tick owns the watermark, so it will still re-read these rows itself
+                snapshot = fire_tracker.apply(fire, advance=False)
+                if snapshot is not None:
+                    changed_fires.append(snapshot)
+            for id in fire_ids - seen: # deleted
+                fire_tracker.forget(id)
+
+            tick_log.info("Evaluated notified fires", extra={"notified": len(fire_ids), "changed": len(changed_fires)})
+            await alert_subscribers(db=db, changed_fires=changed_fires, moved_ids=set())
     except Exception as e:
-        print(f"{Color.RED}[ERROR] CheckFires: Error during Task [check_fire()] - Type {type(e).__name__}: {e}{Color.RESET}", flush=True)
+        tick_log.exception("Evaluating notified fires failed - %s: %s", type(e).__name__, e)
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
+
+
+def on_change_notification(payload: str):
+    # payload comes from the emberalert_notify_change() trigger: {"table", "op", "id"}
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+
+    # evac zone changes need no work here: the zone cache re-checks versions before computing exits
+    if event.get("table") != "fire_data" or not event.get("id"):
+        return
+
+    global _notify_task
+    fire_response_cache.invalidate()
+    if not manager.broker.is_leader:
+        return
+    _pending_fire_ids.add(event["id"])
+    if _notify_task is None or _notify_task.done():
+        _notify_task = asyncio.create_task(_evaluate_pending_fires())
+
+
+async def _evaluate_pending_fires():
+    # gather the burst of notifications a bulk write produces, then evaluate them together
+    while _pending_fire_ids:
+        await asyncio.sleep(settings.FIRE_NOTIFY_BATCH_SECONDS)
+        fire_ids = set(_pending_fire_ids)
+        _pending_fire_ids.clear()
+        await evaluate_fires(fire_ids)
+
+
+async def evaluate_locations(ids: set[str]):
+    """Check subscribers that just connected or moved against the in-memory active fires (no db access)."""
+    async with evaluation_lock:
+        if not manager.broker.is_leader:
+            return # stay in manager.moved for the evaluator's tick
+
+        # the tick may have handled some of them while this waited for the lock
+        ids = ids & manager.moved
+        manager.moved.difference_update(ids)
+        try:
+            await alert_subscribers(db=None, changed_fires=[], moved_ids=ids)
+        except Exception as e:
+            manager.moved.update(id for id in ids if manager.location_of(id) is not None)
+            tick_log.exception("Evaluating moved subscribers failed - %s: %s", type(e).__name__, e)
+
+
+def on_location_change(id: str):
+    global _location_task
+    _pending_location_ids.add(id)
+    if _location_task is None or _location_task.done():
+        _location_task = asyncio.create_task(_evaluate_pending_locations())
+
+
+async def _evaluate_pending_locations():
+    # one evaluation per window however many updates a client sends in it
+    while _pending_location_ids:
+        await asyncio.sleep(settings.LOCATION_DEBOUNCE_SECONDS)
+        ids = set(_pending_location_ids)
+        _pending_location_ids.clear()
+        await evaluate_locations(ids)
+
+
+manager.on_location_change = on_location_change
+
+
+def create_fire_listener() -> PgListener:
+    return PgListener(
+        dsn=to_asyncpg_dsn(active_database_url()),
+        channel=settings.FIRE_NOTIFY_CHANNEL,
+        on_notify=on_change_notification,
+        # notifications sent while disconnected are lost, so catch up with a regular tick
+        on_reconnect=check_fires,
+    )
@@ -1,8 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from config import settings
 
 DEFAULT_RADIUS = 10
 
 class UserLocation(BaseModel):
-    latitude: float 
-    longitude: float
-    radius: float = DEFAULT_RADIUS
\ No newline at end of file
+    # finite, in range coordinates; the radius (meters) is capped so one client can't register a huge alert area
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+    radius: float = Field(DEFAULT_RADIUS, gt=0, le=settings.ALERT_MAX_RADIUS_METERS, allow_inf_nan=False)
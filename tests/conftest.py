@@ -0,0 +1,9 @@
+import os
+import sys
+
+# settings need these at import; nothing here connects to them
+os.environ.setdefault("API_URL", "http://feed.test/incidents")
+os.environ.setdefault("DATABASE_URL", "postgresql://test@localhost/main")
+os.environ.setdefault("TEST_DB_URL", "postgresql://test@localhost/test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
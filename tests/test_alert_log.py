@@ -0,0 +1,121 @@
+import json
+import time
+
+import pytest
+
+from utils.alert_log import AlertLog
+from utils.alert_payload import FireAlertMessage, FireFragment
+from utils.alert_state import AlertStateStore
+
+
+def alert(fire_id: str) -> FireAlertMessage:
+    return FireAlertMessage({fire_id: FireFragment(json.dumps({"id": fire_id}))})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+def filled_log(count: int, size: int = 3) -> tuple[AlertLog, list[int]]:
+    log = AlertLog(size=size, max_devices=10, ttl_seconds=60)
+    return log, [log.append("d", alert(f"F{i}")) for i in range(count)]
+
+
+def test_since_returns_the_missed_tail():
+    log, seqs = filled_log(3)
+    assert seqs == [seqs[0], seqs[0] + 1, seqs[0] + 2]
+    assert [seq for seq, _ in log.since("d", seqs[0])] == seqs[1:]
+    assert [message.fields["seq"] for _, message in log.since("d", seqs[0] - 1)] == seqs
+    assert log.since("d", seqs[-1]) == []
+
+
+def test_since_gives_up_on_gaps_it_cannot_fill():
+    log, seqs = filled_log(5)
+    # the ring holds the last 3; one before the oldest kept is still fillable, earlier isn't
+    assert [seq for seq, _ in log.since("d", seqs[1])] == seqs[2:]
+    assert log.since("d", seqs[0]) is None
+    # a seq from the future (another worker's log, or a restarted one) can't be trusted either
+    assert log.since("d", seqs[-1] + 1) is None
+    assert log.since("unknown", seqs[-1]) is None
+
+
+def test_since_after_ttl(clock):
+    log, seqs = filled_log(2)
+    clock.now += 61
+    assert log.since("d", seqs[0]) is None
+    assert log.evict_expired() == 1
+    assert len(log) == 0
+
+
+def test_discarded_tail_is_not_replayed():
+    log, seqs = filled_log(2)
+    failed = log.append("d", alert("FX"))
+    log.discard("d", failed)
+    assert log.since("d", seqs[-1]) == []
+
+    # only the newest entry can be taken back
+    log.discard("d", seqs[0])
+    assert [seq for seq, _ in log.since("d", seqs[0] - 1)] == seqs
+
+    # numbering carries on past the discarded seq, and the gap it leaves is fillable
+    next_seq = log.append("d", alert("F9"))
+    assert next_seq == failed + 1
+    assert [seq for seq, _ in log.since("d", seqs[-1])] == [next_seq]
+
+
+def test_devices_past_max_are_dropped_least_recent_first():
+    log = AlertLog(size=3, max_devices=2, ttl_seconds=60)
+    first = log.append("a", alert("F1"))
+    log.append("b", alert("F1"))
+    log.append("a", alert("F2"))
+    log.append("c", alert("F1"))
+    assert log.since("b", 0) is None
+    assert [seq for seq, _ in log.since("a", first - 1)] == [first, first + 1]
+
+
+def test_dedup_entries_expire_unless_touched(clock):
+    state = AlertStateStore(max_entries=10, ttl_seconds=60)
+    state.record("d", "F1", "v1")
+    state.record("d", "F2", "v1")
+
+    clock.now += 50
+    # a same-version hit keeps F1 alive, F2 is left alone
+    assert not state.is_new("d", "F1", "v1")
+    assert state.is_new("d", "F1", "v2")
+
+    clock.now += 20
+    assert not state.is_new("d", "F1", "v1")
+    assert state.is_new("d", "F2", "v1")
+    assert len(state) == 1
+
+    clock.now += 61
+    assert state.evict_expired() == 1
+    assert len(state) == 0
+
+
+def test_dedup_evicts_least_recently_touched(clock):
+    state = AlertStateStore(max_entries=2, ttl_seconds=60)
+    state.record("a", "F1", "v1")
+    state.record("b", "F1", "v1")
+    clock.now += 1
+    assert not state.is_new("a", "F1", "v1")
+
+    state.record("c", "F1", "v1")
+    assert not state.is_new("a", "F1", "v1")
+    assert state.is_new("b", "F1", "v1")
+    assert len(state) == 2
+
+    state.forget_device("a")
+    assert state.is_new("a", "F1", "v1")
+    assert len(state) == 1
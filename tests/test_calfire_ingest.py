@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from utils import calfire_ingest
+from utils.calfire_ingest import CalFireIngestor
+
+INCIDENT = {
+    "UniqueId": "u1", "Name": "Alpha Fire", "Location": "x", "County": "Santa Clara",
+    "IsActive": True, "Final": False, "Updated": "2025-08-01T10:00:00Z", "Started": "2025-08-01T08:00:00Z",
+    "AcresBurned": 10, "PercentContained": 5, "Latitude": 37.3, "Longitude": -121.9, "Type": "Wildfire",
+}
+
+
+class StubFeed:
+    """Stub feed server: answers with the queued statuses, then the incident list with an ETag."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=[INCIDENT], headers={"ETag": '"v1"'})
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    # stand-in for the db: upsert records the rows, or raises while `fail` is set
+    state = {"rows": [], "fail": False}
+
+    @contextlib.asynccontextmanager
+    async def session():
+        yield None
+
+    async def upsert(self, db, rows):
+        if state["fail"]:
+            raise ConnectionError("db down")
+        state["rows"].extend(rows)
+
+    monkeypatch.setattr(calfire_ingest, "active_async_session", session)
+    monkeypatch.setattr(CalFireIngestor, "upsert", upsert)
+    return state
+
+
+def make_ingestor(feed: StubFeed) -> CalFireIngestor:
+    return CalFireIngestor(url="http://feed.test/incidents", backoff_seconds=0, transport=httpx.MockTransport(feed))
+
+
+def test_validators_kept_only_after_store(stored):
+    feed = StubFeed()
+    ingestor = make_ingestor(feed)
+
+    stored["fail"] = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(ingestor.run_once())
+
+    # the failed write must not turn the next fetch into a 304
+    stored["fail"] = False
+    assert asyncio.run(ingestor.run_once()) == 1
+    assert "If-None-Match" not in feed.requests[1].headers
+    assert [row["id"] for row in stored["rows"]] == ["u1"]
+
+    assert asyncio.run(ingestor.run_once()) == 0
+    assert feed.requests[2].headers["If-None-Match"] == '"v1"'
+
+
+def test_retries_retryable_status(stored):
+    feed = StubFeed(statuses=[503, 502])
+    assert asyncio.run(make_ingestor(feed).run_once()) == 1
+    assert len(feed.requests) == 3
+
+
+def test_client_error_not_retried(stored):
+    feed = StubFeed(statuses=[404])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(make_ingestor(feed).run_once())
+    assert len(feed.requests) == 1
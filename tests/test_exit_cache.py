@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+import pytest
+from shapely.geometry import Point, Polygon
+from shapely.ops import nearest_points
+
+from utils.evac_zones import METERS_PER_DEGREE_LAT, CachedZone, ExitCache
+
+CELL_METERS = 10
+
+ZONES = {
+    # the seeded Mountain View zone, and a concave one with edges close together
+    "rectangle": Polygon([(-122.090, 37.430), (-122.070, 37.430), (-122.070, 37.410), (-122.090, 37.410)]),
+    "concave": Polygon([(-121.890, 37.340), (-121.870, 37.340), (-121.875, 37.335), (-121.870, 37.330), (-121.890, 37.330), (-121.882, 37.336)]),
+}
+
+
+def points_inside(polygon: Polygon, count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = polygon.bounds
+    while count:
+        lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+        if polygon.contains(Point(lon, lat)):
+            count -= 1
+            yield lat, lon
+
+
+@pytest.mark.parametrize("name", ZONES)
+def test_cached_exit_is_close_to_exact_exit(name):
+    zone = CachedZone(name, None, None, ZONES[name])
+    cache = ExitCache(CELL_METERS, max_entries=100_000)
+    cell_lat = CELL_METERS / METERS_PER_DEGREE_LAT
+
+    shifts = []
+    for lat, lon in points_inside(zone.geometry, 5_000):
+        user = Point(lon, lat)
+        exit_lat, exit_lon = cache.nearest_exit(zone, lat, lon)
+        _, exact = nearest_points(user, zone.boundary)
+
+        # ground distance between the cached and the exact exit
+        meters_per_lon = METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))
+        shifts.append(math.hypot((exit_lat - exact.y) * METERS_PER_DEGREE_LAT, (exit_lon - exact.x) * meters_per_lon))
+
+        # near-ties may pick another part of the boundary, but never more than one cell diagonal farther
+        cell_diagonal = math.hypot(cell_lat, cell_lat / math.cos(math.radians(lat)))
+        assert user.distance(Point(exit_lon, exit_lat)) - user.distance(exact) <= cell_diagonal
+
+    assert np.percentile(shifts, 99) <= math.sqrt(2) / 2 * CELL_METERS
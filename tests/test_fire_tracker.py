@@ -0,0 +1,161 @@
+import asyncio
+import operator
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList
+
+from config import settings
+from db import FireModel
+from utils.fire_tracker import FireTracker
+
+T0 = datetime(2030, 8, 1, 12, tzinfo=timezone.utc)
+
+OPERATORS = {
+    operators.eq: operator.eq,
+    operators.ge: operator.ge,
+    operators.in_op: lambda value, options: value in options,
+}
+
+
+def fire(id: str, updated: datetime = T0, inserted: datetime = T0, **fields) -> FireModel:
+    columns = dict(
+        id=id, name=f"{id} Fire", location="x", county="Santa Clara", is_active=True, final=False,
+        updated_datetime=updated, start_datetime=T0 - timedelta(days=1), acres_burned=10.0,
+        percent_contained=0.0, latitude=37.3, longitude=-121.9, fire_type="Wildfire", inserted_at=inserted,
+    )
+    return FireModel(**{**columns, **fields})
+
+
+def matches(clause, row: FireModel) -> bool:
+    # just enough of a where clause evaluator for the queries FireTracker issues
+    if clause is None:
+        return True
+    if isinstance(clause, BooleanClauseList):
+        results = [matches(part, row) for part in clause.clauses]
+        return any(results) if clause.operator is operators.or_ else all(results)
+    assert isinstance(clause, BinaryExpression)
+    right = getattr(clause.right, "value", True)
+    return OPERATORS[clause.operator](getattr(row, clause.left.key), right)
+
+
+class StubResult:
+    def __init__(self, values):
+        self.values = values
+
+    def scalars(self):
+        return iter(self.values)
+
+
+class StubSession:
+    """A fire_data table in a dict, answering the selects FireTracker runs against it."""
+
+    def __init__(self, *rows: FireModel):
+        self.rows = {row.id: row for row in rows}
+        self.statements = []
+
+    def put(self, row: FireModel):
+        self.rows[row.id] = row
+
+    def _select(self, stmt) -> list[FireModel]:
+        self.statements.append(stmt)
+        return [row for row in self.rows.values() if matches(stmt.whereclause, row)]
+
+    async def execute(self, stmt):
+        rows = self._select(stmt)
+        if stmt.column_descriptions[0]["expr"] is FireModel:
+            return StubResult(rows)
+        key = stmt.column_descriptions[0]["name"]
+        return StubResult([getattr(row, key) for row in rows])
+
+    async def scalar(self, stmt):
+        # only count(*) queries
+        return len(self._select(stmt))
+
+
+def sync(tracker: FireTracker, db: StubSession):
+    changed, removed = asyncio.run(tracker.sync(db))
+    return sorted(fire.id for fire in changed), sorted(removed)
+
+
+def test_stale_replica_row_does_not_replace_newer_snapshot():
+    primary_v2 = fire("F1", updated=T0 + timedelta(minutes=5), acres_burned=50.0)
+    replica = StubSession(fire("F1"))
+    tracker = FireTracker()
+    assert sync(tracker, replica) == (["F1"], [])
+
+    # NOTIFY path: the primary's newer row is applied first
+    assert tracker.apply(primary_v2, advance=False) is not None
+
+    # the replica still serves the older row, on the incremental read and on a reconcile
+    assert sync(tracker, replica) == ([], [])
+    tracker._reconciled_at = None
+    assert sync(tracker, replica) == ([], [])
+    assert tracker.active["F1"].acres_burned == 50.0
+
+    # once the replica catches up nothing is new either
+    replica.put(fire("F1", updated=T0 + timedelta(minutes=5), acres_burned=50.0))
+    assert sync(tracker, replica) == ([], [])
+
+
+def test_insert_update_and_deactivation():
+    db = StubSession(fire("F1"), fire("F2"), fire("OUT", is_active=False))
+    tracker = FireTracker()
+    assert sync(tracker, db) == (["F1", "F2"], [])
+    version = tracker.version
+
+    # nothing changed: the >= watermark re-read brings back F1/F2 but they are filtered out
+    assert sync(tracker, db) == ([], [])
+    assert tracker.version == version
+
+    # new row, stamped by the db after the watermark
+    db.put(fire("F3", inserted=T0 + timedelta(minutes=1)))
+    assert sync(tracker, db) == (["F3"], [])
+
+    # update with a newer feed timestamp
+    db.put(fire("F1", updated=T0 + timedelta(minutes=2), acres_burned=20.0))
+    assert sync(tracker, db) == (["F1"], [])
+    assert tracker.active["F1"].acres_burned == 20.0
+
+    # deactivated with its timestamp bumped
+    db.put(fire("F3", updated=T0 + timedelta(minutes=3), inserted=T0 + timedelta(minutes=1), is_active=False))
+    assert sync(tracker, db) == ([], ["F3"])
+    assert tracker.index.boxes.keys() == {"F1", "F2"}
+
+
+def test_deactivation_without_timestamp_bump(monkeypatch):
+    monkeypatch.setattr(settings, "FIRE_RECONCILE_SECONDS", 3600)
+    db = StubSession(fire("F1"), fire("F2", updated=T0 - timedelta(hours=1), inserted=T0 - timedelta(hours=1)))
+    tracker = FireTracker()
+    sync(tracker, db)
+
+    # F2 is below both watermarks, so only the active count can notice it went away
+    db.rows["F2"].is_active = False
+    assert sync(tracker, db) == ([], ["F2"])
+    del db.rows["F1"]
+    assert sync(tracker, db) == ([], ["F1"])
+    assert len(tracker) == 0
+
+
+def test_update_stamped_before_watermark_is_caught_by_reconcile(monkeypatch):
+    monkeypatch.setattr(settings, "FIRE_RECONCILE_SECONDS", 3600)
+    db = StubSession(fire("F1"), fire("F2", updated=T0 + timedelta(minutes=10), inserted=T0 + timedelta(minutes=10)))
+    tracker = FireTracker()
+    sync(tracker, db)
+
+    # a lagging source sends F1 with a timestamp still behind F2's: the incremental read can't see it
+    db.put(fire("F1", updated=T0 + timedelta(minutes=5), acres_burned=99.0))
+    assert sync(tracker, db) == ([], [])
+
+    monkeypatch.setattr(settings, "FIRE_RECONCILE_SECONDS", 0)
+    assert sync(tracker, db) == (["F1"], [])
+    assert tracker.active["F1"].acres_burned == 99.0
+
+
+def test_switching_env_starts_over(monkeypatch):
+    tracker = FireTracker()
+    sync(tracker, StubSession(fire("F1")))
+
+    monkeypatch.setattr(settings, "ENV", "test" if settings.ENV != "test" else "dev")
+    assert sync(tracker, StubSession(fire("T1"))) == (["T1"], [])
+    assert set(tracker.active) == {"T1"}
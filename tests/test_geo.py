@@ -0,0 +1,55 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from router.websocket import FALLBACK_SAFE_PLACES, get_nearest_fallback_place, get_nearest_fallback_places
+from utils.geo import get_coordinates, get_coordinates_batch
+
+# meters per degree of latitude, close enough to turn small angle errors into distances
+METERS_PER_DEGREE = 111_320
+
+
+def lon_diff(a: float, b: float) -> float:
+    # the scalar version wraps longitudes at the antimeridian, the batch one doesn't
+    return abs((a - b + 180) % 360 - 180)
+
+
+@pytest.mark.parametrize("max_radius", [100, 10_000, 100_000])
+def test_batch_boxes_match_scalar(max_radius):
+    rng = np.random.default_rng(max_radius)
+    # centers kept far enough from the poles that no box crosses one (the scalar version wraps there)
+    latitudes = rng.uniform(-88, 88, 500)
+    longitudes = rng.uniform(-180, 180, 500)
+    radii = rng.uniform(1, max_radius, 500)
+
+    boxes = get_coordinates_batch(latitudes, longitudes, radii)
+    for (min_lat, max_lat, min_lon, max_lon), lat, lon, radius in zip(boxes, latitudes, longitudes, radii):
+        if abs(lat) + math.degrees(radius / 6_356_752) >= 89.9:
+            continue
+        expected = get_coordinates(lat, lon, radius)
+        meters_per_lon = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        assert abs(min_lat - expected.min_lat) * METERS_PER_DEGREE < 0.05
+        assert abs(max_lat - expected.max_lat) * METERS_PER_DEGREE < 0.05
+        assert lon_diff(min_lon, expected.min_lon) * meters_per_lon < 0.05
+        assert lon_diff(max_lon, expected.max_lon) * meters_per_lon < 0.05
+
+
+def test_batch_fallback_places_match_scalar():
+    rng = np.random.default_rng(7)
+    users = rng.uniform((37.0, -122.3), (37.7, -121.5), (300, 2))
+    # random fires, plus some right next to safe places so the exclusion kicks in
+    fires = [SimpleNamespace(latitude=lat, longitude=lon, is_active=True) for lat, lon in rng.uniform((37.0, -122.3), (37.7, -121.5), (20, 2))]
+    fires += [SimpleNamespace(latitude=place["lat"] + 0.01, longitude=place["lon"], is_active=True) for place in FALLBACK_SAFE_PLACES[::3]]
+    fires.append(SimpleNamespace(latitude=FALLBACK_SAFE_PLACES[1]["lat"], longitude=FALLBACK_SAFE_PLACES[1]["lon"], is_active=False))
+
+    for fire_set in ([], fires):
+        batch = get_nearest_fallback_places(users[:, 0].tolist(), users[:, 1].tolist(), fire_set)
+        for (lat, lon), result in zip(users.tolist(), batch):
+            assert result == get_nearest_fallback_place(lat, lon, fire_set)
+
+
+def test_batch_fallback_places_when_every_place_is_excluded():
+    fires = [SimpleNamespace(latitude=place["lat"], longitude=place["lon"], is_active=True) for place in FALLBACK_SAFE_PLACES]
+    assert get_nearest_fallback_places([37.3], [-121.9], fires) == [get_nearest_fallback_place(37.3, -121.9, fires)]
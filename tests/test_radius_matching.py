@@ -0,0 +1,96 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from router import websocket
+from router.websocket import _haversine_km, match_within_radius
+from schema.userlocation import UserLocation
+from utils.geo import EARTH_RADIUS_KM, MinCoordinates
+from utils.spatial_index import GridIndex
+from utils.ws_manager import ConnectionManager
+
+
+def destination(lat: float, lon: float, bearing_deg: float, distance_m: float) -> tuple[float, float]:
+    # point `distance_m` away on the same sphere the radius check uses
+    phi, theta, delta = math.radians(lat), math.radians(bearing_deg), distance_m / 1000 / EARTH_RADIUS_KM
+    phi2 = math.asin(math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(delta) * math.cos(theta))
+    lon2 = math.radians(lon) + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi), math.cos(delta) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), math.degrees(lon2)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = ConnectionManager()
+    monkeypatch.setattr(websocket, "manager", manager)
+    return manager
+
+
+def subscribe(manager: ConnectionManager, locations: dict[str, UserLocation]):
+    for id, location in locations.items():
+        manager.remote[id] = ("other-worker", location)
+        manager._pending_index[id] = location
+    manager.sync_index()
+
+
+def random_world(rng: np.random.Generator, subscribers: int):
+    locations = {
+        f"u{i}": UserLocation(latitude=lat, longitude=lon, radius=radius)
+        for i, (lat, lon, radius) in enumerate(zip(
+            rng.uniform(-70, 70, subscribers), rng.uniform(-179, 179, subscribers), rng.uniform(100, 50_000, subscribers)
+        ))
+    }
+    fires = []
+    for location in locations.values():
+        # just inside/outside the radius in every direction, and out at the box corners
+        for bearing in (0, 45, 90, 135, 180, 225, 270, 315, *rng.uniform(0, 360, 4)):
+            for scale in (0.999, 1.001):
+                fires.append(destination(location.latitude, location.longitude, bearing, location.radius * scale))
+        for bearing in (45, 135, 225, 315):
+            fires.append(destination(location.latitude, location.longitude, bearing, location.radius * 1.3))
+    # and some scattered near the subscribers
+    picks = rng.choice(list(locations.values()), 200)
+    fires += [(p.latitude + dlat, p.longitude + dlon) for p, (dlat, dlon) in zip(picks, rng.uniform(-0.5, 0.5, (200, 2)))]
+    fires = [SimpleNamespace(id=f"F{i}", latitude=lat, longitude=lon) for i, (lat, lon) in enumerate(fires)]
+    return locations, fires
+
+
+def brute_force(locations: dict[str, UserLocation], fires) -> set[tuple[str, str]]:
+    return {
+        (id, fire.id)
+        for id, location in locations.items()
+        for fire in fires
+        if _haversine_km(location.latitude, location.longitude, fire.latitude, fire.longitude) <= location.radius / 1000
+    }
+
+
+def pairs(matches: dict[str, dict]) -> set[tuple[str, str]]:
+    return {(id, fire_id) for id, fires in matches.items() for fire_id in fires}
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_changed_fires_match_brute_force(manager, seed):
+    locations, fires = random_world(np.random.default_rng(seed), 60)
+    subscribe(manager, locations)
+
+    # changed fires -> subscribers whose box covers them, as alert_subscribers does
+    candidates = [(id, fire) for fire in fires for id in manager.index.query_point(fire.latitude, fire.longitude)]
+    expected = brute_force(locations, fires)
+    assert pairs(match_within_radius(candidates)) == expected
+    # the corner fires were candidates that the exact check had to drop
+    assert len(candidates) > len(expected)
+
+
+@pytest.mark.parametrize("seed", [4, 5])
+def test_moved_subscribers_match_brute_force(manager, seed):
+    locations, fires = random_world(np.random.default_rng(seed), 60)
+    subscribe(manager, locations)
+    fire_index = GridIndex()
+    by_id = {fire.id: fire for fire in fires}
+    for fire in fires:
+        fire_index.insert(fire.id, MinCoordinates(fire.latitude, fire.latitude, fire.longitude, fire.longitude))
+
+    # moved subscribers -> fires inside their box
+    candidates = [(id, by_id[fire_id]) for id in locations for fire_id in fire_index.query_box(manager.index.boxes[id])]
+    assert pairs(match_within_radius(candidates)) == brute_force(locations, fires)
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+from fastapi import Request
+
+from utils.response_cache import CachedResponse, conditional_response
+
+SINCE = "Wed, 01 Jan 2031 00:00:00 GMT"
+
+
+def request(**headers: str) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": raw})
+
+
+def test_list_entry_is_validated_by_etag_only():
+    # list pages carry no Last-Modified: a newest-row time can't see rows added with older stamps or removed
+    entry = CachedResponse(b"[]", None)
+    response = conditional_response(request(if_modified_since=SINCE), entry)
+    assert response.status_code == 200
+    assert "last-modified" not in response.headers
+
+    assert conditional_response(request(if_none_match=entry.etag), entry).status_code == 304
+
+
+def test_single_fire_entry_honours_if_modified_since():
+    entry = CachedResponse(b"{}", datetime(2030, 6, 1, tzinfo=timezone.utc))
+    assert conditional_response(request(if_modified_since=SINCE), entry).status_code == 304
+    assert conditional_response(request(if_modified_since="Sat, 01 Jun 2030 00:00:00 GMT"), entry).status_code == 304
+    assert conditional_response(request(if_modified_since="Fri, 31 May 2030 00:00:00 GMT"), entry).status_code == 200
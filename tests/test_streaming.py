@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+from sqlalchemy import column, select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from utils.streaming import ndjson_response
+
+
+class StubResult:
+    def __init__(self, batches):
+        self.batches = batches
+
+    async def partitions(self):
+        for batch in self.batches:
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+
+
+class StubSession:
+    """Hands out the queued batches (an exception in the list is raised when reached)."""
+
+    def __init__(self, batches=(), error=None):
+        self.batches = list(batches)
+        self.error = error
+        self.closed = False
+
+    async def stream_scalars(self, stmt):
+        if self.error:
+            raise self.error
+        return StubResult(self.batches)
+
+    async def close(self):
+        self.closed = True
+
+
+def respond(session: StubSession):
+    return asyncio.run(ndjson_response(select(column("n")), TypeAdapter(int), lambda: session))
+
+
+async def respond_and_read(session: StubSession) -> bytes:
+    # one loop for both: asyncio.run closes the cursor's generator when its loop ends
+    response = await ndjson_response(select(column("n")), TypeAdapter(int), lambda: session)
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.mark.parametrize("error, code", [
+    (OperationalError("select", {}, Exception("refused")), 503),
+    (SQLAlchemyError("broken"), 500),
+])
+def test_failed_query_is_an_error_response(error, code):
+    session = StubSession(error=error)
+    with pytest.raises(HTTPException) as raised:
+        respond(session)
+    assert raised.value.status_code == code
+    assert session.closed
+
+
+def test_first_batch_error_is_an_error_response():
+    session = StubSession([OperationalError("fetch", {}, Exception("reset"))])
+    with pytest.raises(HTTPException) as raised:
+        respond(session)
+    assert raised.value.status_code == 503
+    assert session.closed
+
+
+def test_later_batch_error_truncates_stream():
+    session = StubSession([[1, 2], [3], SQLAlchemyError("lost"), [4]])
+    assert asyncio.run(respond_and_read(session)) == b"1\n2\n3\n"
+    assert session.closed
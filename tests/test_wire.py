@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils.wire import WireProtocol
+
+
+def handshake(query=None, headers=None):
+    return SimpleNamespace(query_params=query or {}, headers=headers or {})
+
+
+def test_negotiate_hello_overrides_query():
+    protocol, requested = WireProtocol.negotiate(handshake({"format": "json"}), {"protocol": {"format": "msgpack", "delta": "1"}})
+    assert (protocol.format, protocol.delta, requested) == ("msgpack", True, True)
+
+
+@pytest.mark.parametrize("options", [["msgpack"], "msgpack", 1])
+def test_negotiate_rejects_non_object_protocol(options):
+    with pytest.raises(ValueError):
+        WireProtocol.negotiate(handshake(), {"protocol": options})
+
+
+@pytest.mark.parametrize("fires", [["F1"], "F1", 3])
+def test_ack_rejects_non_object(fires):
+    with pytest.raises(ValueError):
+        WireProtocol(delta=True).ack(fires)
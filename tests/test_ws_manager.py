@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+from config import settings
+from schema.userlocation import UserLocation
+from utils.alert_payload import FireAlertMessage, FireFragment
+from utils.broker import Broker
+from utils.ws_manager import ConnectionManager, SendQueue
+
+PING = {"type": "ping"}
+
+
+def alert(*fire_ids: str) -> FireAlertMessage:
+    return FireAlertMessage({fire_id: FireFragment(json.dumps({"id": fire_id})) for fire_id in fire_ids}, {"num_fires": len(fire_ids)})
+
+
+def queued_fires(queue: SendQueue) -> list[str]:
+    return [fire_id for item in queue.items if isinstance(item, FireAlertMessage) for fire_id in item.fires]
+
+
+def queue_items_are_alerts(queue: SendQueue) -> bool:
+    return all(isinstance(item, FireAlertMessage) for item in queue.items)
+
+
+def test_drop_oldest_keeps_every_alert():
+    # the stalled socket case: pings and alerts share a full queue
+    queue = SendQueue(maxsize=2, policy="drop_oldest")
+    assert queue.put(alert("F1"))
+    assert queue.put(PING)
+    for fire_id in ("F2", "F3", "F4"):
+        assert queue.put(alert(fire_id))
+
+    assert len(queue) == 2
+    assert PING not in queue.items
+    assert sorted(queued_fires(queue)) == ["F1", "F2", "F3", "F4"]
+    assert queue.items[-1].fields["num_fires"] == 3
+
+
+def test_drop_oldest_drops_plain_message_before_alert():
+    queue = SendQueue(maxsize=2, policy="drop_oldest")
+    queue.put(alert("F1"))
+    queue.put(alert("F2"))
+    assert queue.put(PING)
+    assert queue_items_are_alerts(queue)
+
+    queue = SendQueue(maxsize=2, policy="drop_oldest")
+    queue.put("first")
+    queue.put(alert("F1"))
+    queue.put("second")
+    assert list(queue.items)[1:] == ["second"]
+
+
+def test_coalesce_replaces_same_type_and_merges_alerts():
+    queue = SendQueue(maxsize=2, policy="coalesce")
+    queue.put({"type": "message", "message": "old"})
+    queue.put(alert("F1"))
+    assert queue.put({"type": "message", "message": "new"})
+    assert queue.items[0] == {"type": "message", "message": "new"}
+
+    assert queue.put(alert("F2"))
+    assert len(queue) == 2
+    assert queued_fires(queue) == ["F1", "F2"]
+
+    # nothing of its type to replace: still drops the plain message, not the alert
+    assert queue.put(PING)
+    assert queued_fires(queue) == ["F1", "F2"]
+    assert queue.items[-1] == PING
+
+
+def test_disconnect_refuses_when_full():
+    queue = SendQueue(maxsize=1, policy="disconnect")
+    assert queue.put(alert("F1"))
+    assert not queue.put(alert("F2"))
+    assert queued_fires(queue) == ["F1"]
+
+
+def local_manager(*ids: str) -> ConnectionManager:
+    # connections reduced to what queueing needs
+    manager = ConnectionManager()
+    for id in ids:
+        manager.active_connections[id] = {"queue": SendQueue(maxsize=8, policy="drop_oldest"), "location": None}
+    return manager
+
+
+def test_resume_replays_missed_alerts():
+    manager = local_manager("d")
+    seqs = [manager.alert_log.append("d", alert(f"F{i}")) for i in range(3)]
+    manager.alert_state.record("d", "F0", "v1")
+
+    asyncio.run(manager._resume("d", seqs[0]))
+    assert queued_fires(manager.active_connections["d"]["queue"]) == ["F1", "F2"]
+    assert not manager.alert_state.is_new("d", "F0", "v1")
+
+
+@pytest.mark.parametrize("last_seq", [None, 0, "future"])
+def test_resume_starts_over_when_the_gap_is_unknown(last_seq):
+    manager = local_manager("d")
+    seq = manager.alert_log.append("d", alert("F0"))
+    manager.alert_state.record("d", "F0", "v1")
+
+    asyncio.run(manager._resume("d", seq + 1 if last_seq == "future" else last_seq))
+    assert len(manager.active_connections["d"]["queue"]) == 0
+    # dedup state dropped, so the next evaluation sends every relevant fire again
+    assert manager.alert_state.is_new("d", "F0", "v1")
+
+
+class RecordingBroker(Broker):
+    def __init__(self):
+        super().__init__()
+        self.published: list[tuple[str, dict]] = []
+
+    async def publish(self, channel: str, message: dict):
+        self.published.append((channel, message))
+
+    async def elect(self) -> bool:
+        return False
+
+
+def test_broker_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
+
+
+def test_location_updates_publish_one_join_per_window(monkeypatch):
+    monkeypatch.setattr(settings, "LOCATION_DEBOUNCE_SECONDS", 0.01)
+    broker = RecordingBroker()
+    manager = ConnectionManager(broker)
+    manager.active_connections["a"] = {"queue": SendQueue(maxsize=8, policy="drop_oldest"), "location": None}
+    manager.active_connections["b"] = {"queue": SendQueue(maxsize=8, policy="drop_oldest"), "location": None}
+
+    async def scenario():
+        for latitude in (37.1, 37.2, 37.3):
+            await manager.update_location("a", UserLocation(latitude=latitude, longitude=-121.9))
+            await manager.update_location("b", UserLocation(latitude=latitude, longitude=-121.9))
+        # b leaves inside the window: its pending move must not resurrect it
+        await manager.disconnect("b")
+        await asyncio.sleep(0.05)
+        await manager.stop_broker()
+
+    asyncio.run(scenario())
+    presence = [(message["op"], message["id"], message.get("location", {}).get("latitude")) for _, message in broker.published]
+    assert presence == [("leave", "b", None), ("join", "a", 37.3)]
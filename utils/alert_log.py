@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict, deque
+from utils.alert_payload import FireAlertMessage
+
+
+class AlertLog:
+    """
+    The last `size` alerts sent to each device, numbered so a reconnecting client can ask for just
+    what it missed. Devices untouched for `ttl_seconds` are dropped, and the least recently alerted
+    past `max_devices`. Fire fragments are shared between messages, so a log mostly holds references.
+
+    Sequence numbers start from the wall clock (ms) when a device's log is created, so they keep
+    increasing when another worker rebuilds the log after taking over evaluation.
+    """
+
+    def __init__(self, size: int, max_devices: int, ttl_seconds: float):
+        self.size = size
+        self.max_devices = max_devices
+        self.ttl_seconds = ttl_seconds
+        # device id -> [entries (seq, message), last seq, last touched], least recently touched first
+        self._devices: OrderedDict[str, list] = OrderedDict()
+
+    def append(self, device_id: str, message: FireAlertMessage) -> int:
+        """Number the message (its "seq" field) and keep it. Returns the sequence number."""
+        log = self._devices.get(device_id)
+        if log is None:
+            log = self._devices[device_id] = [deque(maxlen=self.size), time.time_ns() // 1_000_000, 0.0]
+        log[1] += 1
+        log[2] = time.monotonic()
+        self._devices.move_to_end(device_id)
+
+        message.fields["seq"] = log[1]
+        log[0].append((log[1], message))
+
+        while len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+        return log[1]
+
+    def discard(self, device_id: str, seq: int):
+        # take back the newest entry when its delivery failed
+        log = self._devices.get(device_id)
+        if log is not None and log[0] and log[0][-1][0] == seq:
+            log[0].pop()
+
+    def since(self, device_id: str, last_seq: int) -> list[tuple[int, FireAlertMessage]] | None:
+        """
+        Alerts numbered after `last_seq`, oldest first, or None when the log can't tell what was
+        missed (unknown device, expired, or the gap is older than what the ring buffer holds).
+        """
+        log = self._devices.get(device_id)
+        if log is None or time.monotonic() - log[2] > self.ttl_seconds:
+            return None
+
+        entries, newest, _ = log
+        oldest = entries[0][0] if entries else newest + 1
+        if last_seq > newest or last_seq < oldest - 1:
+            return None
+        return [(seq, message) for seq, message in entries if seq > last_seq]
+
+    def forget_device(self, device_id: str):
+        self._devices.pop(device_id, None)
+
+    def evict_expired(self) -> int:
+        # devices are ordered by last alert, so stop at the first one that's still fresh
+        cutoff = time.monotonic() - self.ttl_seconds
+        evicted = 0
+        while self._devices:
+            _, (_, _, touched) = next(iter(self._devices.items()))
+            if touched > cutoff:
+                break
+            self._devices.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._devices)
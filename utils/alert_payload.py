@@ -0,0 +1,122 @@
+import hashlib
+import json
+from functools import cached_property
+import msgpack
+from schema.fireschema import FireSchema
+
+
+class FireFragment:
+    """
+    One fire snapshot encoded once and shared by every alert it is part of.
+    The other encodings (msgpack, parsed fields, version) are only computed if some client needs them.
+    """
+
+    def __init__(self, json_text: str):
+        self.json = json_text
+
+    @cached_property
+    def fields(self) -> dict:
+        return json.loads(self.json)
+
+    @cached_property
+    def version(self) -> str:
+        # content hash, so every worker names the same snapshot the same way
+        return hashlib.blake2b(self.json.encode(), digest_size=6).hexdigest()
+
+    @cached_property
+    def packed(self) -> bytes:
+        return msgpack.packb(self.fields)
+
+    @cached_property
+    def versioned_json(self) -> str:
+        return self.json[:-1] + ',"v":"' + self.version + '"}'
+
+    @cached_property
+    def versioned_packed(self) -> bytes:
+        return msgpack.packb({**self.fields, "v": self.version})
+
+
+class FireFragments:
+    """
+    Encoding of each fire, done once per evaluation and shared by every subscriber it is sent to.
+    Keyed by fire id; a different snapshot of the same fire (it changed) is re-encoded.
+    """
+
+    def __init__(self):
+        self._encoded: dict[str, tuple[FireSchema, FireFragment]] = {}
+
+    def get(self, fire: FireSchema) -> FireFragment:
+        cached = self._encoded.get(fire.id)
+        if cached is not None and cached[0] is fire:
+            return cached[1]
+        fragment = FireFragment(fire.model_dump_json())
+        self._encoded[fire.id] = (fire, fragment)
+        return fragment
+
+    def __len__(self) -> int:
+        return len(self._encoded)
+
+
+class FireAlertMessage:
+    """
+    A fire_alert payload built from pre-encoded fire fragments.
+    Only the small per-user part (safe place etc.) is encoded per recipient, when the message is sent.
+    """
+
+    type = "fire_alert"
+
+    def __init__(self, fires: dict[str, FireFragment], fields: dict | None = None):
+        # fire id -> encoded fire
+        self.fires = fires
+        self.fields = fields or {}
+
+    def merge(self, newer: "FireAlertMessage") -> "FireAlertMessage":
+        # one entry per fire id, newer data wins
+        fields = {**self.fields, **newer.fields}
+        fires = {**self.fires, **newer.fires}
+        if "num_fires" in fields:
+            fields["num_fires"] = len(fires)
+        return FireAlertMessage(fires, fields)
+
+    def encode(self) -> str:
+        text = '{"type":"fire_alert","fires":[' + ",".join(fire.json for fire in self.fires.values()) + "]"
+        if self.fields:
+            text += "," + json.dumps(self.fields, separators=(",", ":"))[1:-1]
+        return text + "}"
+
+    def encode_packed(self) -> bytes:
+        # same document as encode(), in msgpack, built from the pre-packed fires
+        packer = msgpack.Packer()
+        parts = [
+            packer.pack_map_header(2 + len(self.fields)),
+            packer.pack("type"), packer.pack(self.type),
+            packer.pack("fires"), packer.pack_array_header(len(self.fires)),
+            *(fire.packed for fire in self.fires.values()),
+        ]
+        for key, value in self.fields.items():
+            parts += [packer.pack(key), packer.pack(value)]
+        return b"".join(parts)
+
+    def to_broker(self) -> dict:
+        return {"fires": {fire_id: fire.json for fire_id, fire in self.fires.items()}, "fields": self.fields}
+
+    @classmethod
+    def from_broker(cls, message: dict) -> "FireAlertMessage":
+        return cls({fire_id: FireFragment(text) for fire_id, text in message["fires"].items()}, message.get("fields"))
+
+    def split(self, max_bytes: int | None) -> list["FireAlertMessage"]:
+        # smaller alerts (each with the per-user fields) whose encoded text fits in max_bytes
+        if max_bytes is None or len(self.encode().encode()) <= max_bytes:
+            return [self]
+
+        parts: list[FireAlertMessage] = []
+        current: dict[str, FireFragment] = {}
+        for fire_id, fire in self.fires.items():
+            candidate = FireAlertMessage({**current, fire_id: fire}, self.fields)
+            if current and len(candidate.encode().encode()) > max_bytes:
+                parts.append(FireAlertMessage(current, self.fields))
+                current = {}
+            current[fire_id] = fire
+        if current:
+            parts.append(FireAlertMessage(current, self.fields))
+        return parts
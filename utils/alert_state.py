@@ -0,0 +1,102 @@
+import hashlib
+import time
+from collections import OrderedDict
+from schema.fireschema import FireSchema
+
+# fields whose change is worth re-alerting a user about, with the rounding that counts as "changed"
+# (updated_datetime is left out on purpose: the feed bumps it without anything material changing)
+MATERIAL_FIELDS: dict[str, int | None] = {
+    "name": None,
+    "is_active": None,
+    "final": None,
+    "fire_type": None,
+    "control_statement": None,
+    "extinguished_datetime": None,
+    "acres_burned": 0,        # whole acres
+    "percent_contained": 0,   # whole percent
+    "latitude": 4,            # ~11 m
+    "longitude": 4,
+}
+
+
+def alert_version(fire: FireSchema) -> str:
+    """Short hash of a fire's material fields; equal versions mean nothing worth re-alerting changed."""
+    values = []
+    for field, digits in MATERIAL_FIELDS.items():
+        value = getattr(fire, field)
+        if digits is not None and value is not None:
+            value = round(value, digits)
+        values.append(value)
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+
+class AlertStateStore:
+    """
+    Which version of each fire every device was last alerted about, keyed by (device id, fire id).
+    Entries expire after `ttl_seconds` without being touched and the oldest are evicted past
+    `max_entries`, so memory stays bounded no matter how many devices come and go.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (device id, fire id) -> (version, last touched), least recently touched first
+        self._entries: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+        self._fires_by_device: dict[str, set[str]] = {}
+
+    def is_new(self, device_id: str, fire_id: str, version: str) -> bool:
+        key = (device_id, fire_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return True
+
+        seen_version, touched = entry
+        now = time.monotonic()
+        if now - touched > self.ttl_seconds:
+            self._remove(key)
+            return True
+        if seen_version != version:
+            return True
+
+        # still relevant to the device: keep the entry alive so it doesn't expire while the fire burns
+        self._entries[key] = (seen_version, now)
+        self._entries.move_to_end(key)
+        return False
+
+    def record(self, device_id: str, fire_id: str, version: str):
+        key = (device_id, fire_id)
+        self._entries[key] = (version, time.monotonic())
+        self._entries.move_to_end(key)
+        self._fires_by_device.setdefault(device_id, set()).add(fire_id)
+
+        while len(self._entries) > self.max_entries:
+            oldest, _ = next(iter(self._entries.items()))
+            self._remove(oldest)
+
+    def forget_device(self, device_id: str):
+        for fire_id in self._fires_by_device.pop(device_id, ()):
+            self._entries.pop((device_id, fire_id), None)
+
+    def evict_expired(self) -> int:
+        # entries are ordered by last touch, so stop at the first one that's still fresh
+        cutoff = time.monotonic() - self.ttl_seconds
+        evicted = 0
+        while self._entries:
+            key, (_, touched) = next(iter(self._entries.items()))
+            if touched > cutoff:
+                break
+            self._remove(key)
+            evicted += 1
+        return evicted
+
+    def _remove(self, key: tuple[str, str]):
+        self._entries.pop(key, None)
+        device_id, fire_id = key
+        fires = self._fires_by_device.get(device_id)
+        if fires is not None:
+            fires.discard(fire_id)
+            if not fires:
+                del self._fires_by_device[device_id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
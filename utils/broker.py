@@ -0,0 +1,147 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Callable
+import asyncpg
+
+from utils.pg_notify import PgListener
+from utils.log import get_logger
+
+log = get_logger("broker")
+
+# NOTIFY payloads must be under 8000 bytes
+PG_NOTIFY_MAX_BYTES = 7999
+
+
+class Broker(ABC):
+    """
+    Pub/sub between API workers, plus the election of the one worker that evaluates fires.
+    Handlers get the decoded message dict and must not block; messages a worker publishes
+    are delivered to its own handlers too, so they carry an origin to tell them apart.
+    """
+
+    # budget for one alert's encoded text inside a message (None = unlimited)
+    max_message_bytes: int | None = None
+
+    def __init__(self):
+        self.is_leader = False
+        self._handlers: dict[str, list[Callable[[dict], None]]] = {}
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def _dispatch(self, channel: str, message: dict):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception as e:
+                log.error("Handler failed on '%s' - %s: %s", channel, type(e).__name__, e)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.is_leader = False
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+    @abstractmethod
+    async def elect(self) -> bool:
+        """Try to become (or stay) the evaluating worker. Returns whether this worker is it."""
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker: every message goes straight back to this process and it is always the leader."""
+
+    def __init__(self):
+        super().__init__()
+        # leader from the start, so evaluations before the first tick's elect() aren't skipped
+        self.is_leader = True
+
+    async def start(self):
+        self.is_leader = True
+
+    async def publish(self, channel: str, message: dict):
+        self._dispatch(channel, message)
+
+    async def elect(self) -> bool:
+        self.is_leader = True
+        return True
+
+
+class PostgresBroker(Broker):
+    """
+    Broker over Postgres LISTEN/NOTIFY, so workers on any host sharing the database can talk.
+    The leader is whoever holds a session-level advisory lock on a dedicated connection; if that
+    connection (or the worker) dies the lock is released and another worker takes over on its next elect().
+    """
+
+    # leaves room for the json envelope and the escaping of the alert text inside it
+    max_message_bytes = 6000
+
+    def __init__(self, dsn: str, prefix: str, lock_key: int):
+        super().__init__()
+        self.dsn = dsn
+        self.prefix = prefix
+        self.lock_key = lock_key
+        self._pool: asyncpg.Pool | None = None
+        self._listeners: list[PgListener] = []
+        self._lock_conn: asyncpg.Connection | None = None
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.prefix}_{channel}"
+
+    async def start(self):
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        for channel in self._handlers:
+            listener = PgListener(
+                dsn=self.dsn,
+                channel=self._channel(channel),
+                on_notify=lambda payload, channel=channel: self._dispatch(channel, json.loads(payload)),
+            )
+            listener.start()
+            self._listeners.append(listener)
+
+    async def stop(self):
+        for listener in self._listeners:
+            await listener.stop()
+        self._listeners.clear()
+        # closing the lock connection releases the advisory lock for the next leader
+        await self._release()
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def publish(self, channel: str, message: dict):
+        payload = json.dumps(message, separators=(",", ":"))
+        if len(payload.encode()) > PG_NOTIFY_MAX_BYTES:
+            raise ValueError(f"broker message on '{channel}' is {len(payload.encode())} bytes, NOTIFY allows {PG_NOTIFY_MAX_BYTES}")
+        await self._pool.execute("SELECT pg_notify($1, $2)", self._channel(channel), payload)
+
+    async def elect(self) -> bool:
+        try:
+            if self._lock_conn is None or self._lock_conn.is_closed():
+                self.is_leader = False
+                self._lock_conn = await asyncpg.connect(self.dsn)
+
+            if self.is_leader:
+                # still holding the lock as long as the connection is alive
+                await self._lock_conn.execute("SELECT 1")
+            else:
+                self.is_leader = await self._lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key)
+                if self.is_leader:
+                    log.info("This worker is now the fire evaluator")
+        except Exception as e:
+            log.error("Leader election failed - %s: %s", type(e).__name__, e)
+            await self._release()
+        return self.is_leader
+
+    async def _release(self):
+        self.is_leader = False
+        if self._lock_conn is not None and not self._lock_conn.is_closed():
+            try:
+                await self._lock_conn.close(timeout=2)
+            except Exception:
+                self._lock_conn.terminate()
+        self._lock_conn = None
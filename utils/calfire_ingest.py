@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from datetime import datetime, date, timezone
+import httpx
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import FireModel, active_async_session
+from config import settings
+from utils.log import get_logger, setup_logging
+
+log = get_logger("calfire_ingest")
+
+# columns the feed owns; inserted_at is left to the db default
+FEED_COLUMNS = [
+    "name", "location", "county", "is_active", "final",
+    "updated_datetime", "start_datetime", "extinguished_datetime", "start_date",
+    "acres_burned", "percent_contained", "latitude", "longitude",
+    "fire_type", "control_statement", "url",
+]
+
+# rows per INSERT statement (asyncpg allows at most 32767 bind params)
+UPSERT_BATCH_SIZE = 1000
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _parse_datetime(value) -> datetime | None:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    # the feed sometimes drops the offset; treat those as UTC
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_date(value) -> date | None:
+    if not value:
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+
+def normalize_incident(incident: dict) -> dict | None:
+    """Map one Cal Fire incident to FireModel column values, or None if it can't be stored."""
+    try:
+        if not incident.get("UniqueId") or incident.get("Latitude") is None or incident.get("Longitude") is None:
+            return None
+
+        started = _parse_datetime(incident.get("Started"))
+        updated = _parse_datetime(incident.get("Updated")) or started
+        if started is None or updated is None:
+            return None
+
+        return {
+            "id": str(incident["UniqueId"]),
+            "name": incident.get("Name") or "Unknown Fire",
+            "location": incident.get("Location") or "",
+            "county": incident.get("County") or "",
+            "is_active": bool(incident.get("IsActive")),
+            "final": bool(incident.get("Final")),
+            "updated_datetime": updated,
+            "start_datetime": started,
+            "extinguished_datetime": _parse_datetime(incident.get("ExtinguishedDate")),
+            "start_date": _parse_date(incident.get("StartedDateOnly")),
+            "acres_burned": float(incident.get("AcresBurned") or 0),
+            "percent_contained": float(incident.get("PercentContained") or 0),
+            "latitude": float(incident["Latitude"]),
+            "longitude": float(incident["Longitude"]),
+            "fire_type": incident.get("Type") or "Wildfire",
+            "control_statement": incident.get("ControlStatement"),
+            "url": incident.get("Url"),
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+def content_hash(row: dict) -> str:
+    return hashlib.blake2b(json.dumps(row, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+class CalFireIngestor:
+    """
+    Pulls the Cal Fire incident list and upserts it into fire_data.
+
+    One pooled httpx client is reused across runs, requests are conditional on the last
+    ETag/Last-Modified, and failures are retried with backoff. Rows whose content hash matches
+    the last run are not sent; the upsert's WHERE clause also skips rows identical to what's stored.
+    """
+
+    def __init__(
+        self,
+        url: str | None = None,
+        max_retries: int = 3,
+        backoff_seconds: float = 1.0,
+        timeout_seconds: float = 20.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.url = url or settings.API_URL
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.client = httpx.AsyncClient(
+            timeout=timeout_seconds,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            headers={"Accept": "application/json"},
+            transport=transport,
+        )
+        self._etag: str | None = None
+        self._last_modified: str | None = None
+        # validators of the last fetched response, kept once its incidents are stored
+        self._fetched_validators: tuple[str | None, str | None] = (None, None)
+        self._hashes: dict[str, str] = {}
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def fetch(self) -> list[dict] | None:
+        """Incident list, or None if the feed hasn't changed since the last fetch."""
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.get(self.url, headers=headers)
+                if response.status_code == 304:
+                    return None
+                if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    raise httpx.HTTPStatusError("retryable status", request=response.request, response=response)
+                response.raise_for_status()
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                # other 4xx won't change on a retry
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in RETRY_STATUS:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() / 2)
+                log.warning("Fetch failed (%s), retrying in %.1fs", type(e).__name__, delay)
+                await asyncio.sleep(delay)
+
+        # not used for conditional requests until run_once() has stored the incidents,
+        # otherwise a failed write would be answered with 304 from then on
+        self._fetched_validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        data = response.json()
+        # the list endpoint returns a bare array, the geojson one a FeatureCollection
+        if isinstance(data, dict) and "features" in data:
+            return [feature.get("properties") or {} for feature in data["features"]]
+        return data
+
+    def changed_rows(self, incidents: list[dict]) -> list[tuple[dict, str]]:
+        # (row, content hash) for incidents that differ from the last stored run
+        rows: dict[str, tuple[dict, str]] = {}
+        for incident in incidents:
+            row = normalize_incident(incident)
+            if row is None:
+                continue
+            digest = content_hash(row)
+            if self._hashes.get(row["id"]) == digest:
+                continue
+            rows[row["id"]] = (row, digest)
+        return list(rows.values())
+
+    async def upsert(self, db: AsyncSession, rows: list[dict]):
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            stmt = insert(FireModel).values(rows[start:start + UPSERT_BATCH_SIZE])
+            columns = [getattr(FireModel, column) for column in FEED_COLUMNS]
+            excluded = [getattr(stmt.excluded, column) for column in FEED_COLUMNS]
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FireModel.id],
+                set_={column: getattr(stmt.excluded, column) for column in FEED_COLUMNS},
+                # don't rewrite rows that already hold exactly this data
+                where=tuple_(*columns).is_distinct_from(tuple_(*excluded)),
+            )
+            await db.execute(stmt)
+        await db.commit()
+
+    async def run_once(self) -> int:
+        """Fetch, normalize and upsert. Returns the number of rows written."""
+        incidents = await self.fetch()
+        if incidents is None:
+            log.info("Feed not modified")
+            return 0
+
+        changed = self.changed_rows(incidents)
+        if changed:
+            async with active_async_session() as db:
+                await self.upsert(db, [row for row, _ in changed])
+            # only remember hashes once they're stored
+            self._hashes.update({row["id"]: digest for row, digest in changed})
+        self._etag, self._last_modified = self._fetched_validators
+
+        log.info("Ingested feed", extra={"incidents": len(incidents), "changed": len(changed)})
+        return len(changed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Ingest the Cal Fire incident feed into fire_data")
+    parser.add_argument("--url", default=None, help="feed url (defaults to settings.API_URL)")
+    parser.add_argument("--interval", type=float, default=0, help="repeat every N seconds (0 = run once)")
+    args = parser.parse_args()
+    setup_logging()
+
+    ingestor = CalFireIngestor(url=args.url)
+    try:
+        while True:
+            try:
+                await ingestor.run_once()
+            except Exception as e:
+                if not args.interval:
+                    raise
+                # a transient feed or db failure shouldn't end the loop; the next run retries
+                log.error("Ingest failed - %s: %s", type(e).__name__, e)
+            if not args.interval:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await ingestor.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
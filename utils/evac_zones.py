@@ -0,0 +1,194 @@
+import json
+import math
+from collections import OrderedDict
+from datetime import datetime
+import shapely
+from shapely import STRtree
+from shapely.geometry import shape, Point
+from shapely.ops import nearest_points
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import EvacZoneModel
+from config import settings
+from utils.metrics import EXIT_CACHE_LOOKUPS
+
+METERS_PER_DEGREE_LAT = 111_320
+
+
+class CachedZone:
+    """Parsed, prepared geometry of one active evac zone row."""
+
+    def __init__(self, id: str, name: str | None, updated_at: datetime | None, geometry):
+        self.id = id
+        self.name = name
+        self.updated_at = updated_at
+        self.geometry = geometry
+        self.boundary = geometry.boundary
+        # prepared in place so repeated contains() checks are fast
+        shapely.prepare(self.geometry)
+
+
+class ExitCache:
+    """
+    LRU of nearest boundary points keyed by (zone id, zone updated_at, location cell).
+    Each exit is computed from the center of a `cell_meters` square cell, so everyone in the cell
+    shares it. The cached exit is within half a cell diagonal (sqrt(2)/2 * cell_meters) of the exact
+    one, except for users almost equally close to two parts of the boundary, where the other part may
+    be picked; even then it is at most one cell diagonal farther away (measured the way nearest_exit
+    compares exits, in lon/lat).
+    """
+
+    def __init__(self, cell_meters: float, max_entries: int):
+        self.cell_lat = cell_meters / METERS_PER_DEGREE_LAT
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int, float, float]:
+        # cells are square on the ground: longitude steps widen with the cosine of the cell row's latitude
+        row = math.floor(lat / self.cell_lat)
+        center_lat = (row + 0.5) * self.cell_lat
+        cell_lon = self.cell_lat / max(math.cos(math.radians(center_lat)), 1e-6)
+        col = math.floor(lon / cell_lon)
+        return row, col, center_lat, (col + 0.5) * cell_lon
+
+    def nearest_exit(self, zone: "CachedZone", lat: float, lon: float) -> tuple[float, float]:
+        """(lat, lon) of the exit on `zone`'s boundary for the cell holding (lat, lon)."""
+        row, col, center_lat, center_lon = self._cell(lat, lon)
+        key = (zone.id, zone.updated_at, row, col)
+        exit = self._entries.get(key)
+        if exit is not None:
+            self._entries.move_to_end(key)
+            EXIT_CACHE_LOOKUPS.inc(result="hit")
+            return exit
+
+        EXIT_CACHE_LOOKUPS.inc(result="miss")
+        _, nearest_on_boundary = nearest_points(Point(center_lon, center_lat), zone.boundary)
+        exit = (float(nearest_on_boundary.y), float(nearest_on_boundary.x))
+        self._entries[key] = exit
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return exit
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EvacZoneCache:
+    """
+    Process-wide cache of active evac zones, indexed with an STRtree.
+    Zones are keyed on (id, updated_at): refresh() only re-parses rows whose updated_at changed,
+    and drops zones that were deleted or deactivated. Rows with no updated_at are parsed once.
+    """
+
+    def __init__(self):
+        self.zones: dict[str, CachedZone] = {}
+        # zones whose geometry is missing/invalid at a given updated_at, so they aren't re-parsed every tick
+        self._skipped: dict[str, datetime | None] = {}
+        self._tree: STRtree | None = None
+        self._tree_zones: list[CachedZone] = []
+        self._env: str | None = None
+        # zone versions are part of the key, so edited zones never serve old exits
+        self.exits = ExitCache(settings.EXIT_CACHE_CELL_METERS, settings.EXIT_CACHE_MAX_ENTRIES)
+
+    def clear(self):
+        self.exits.clear()
+        self.zones.clear()
+        self._skipped.clear()
+        self._tree = None
+        self._tree_zones = []
+
+    async def refresh(self, db: AsyncSession):
+        # the active db can be switched at runtime (/utils/change-db)
+        if self._env != settings.ENV:
+            self.clear()
+            self._env = settings.ENV
+
+        # only ids + versions are read here; full rows are loaded just for the zones that changed
+        result = await db.execute(
+            select(EvacZoneModel.id, EvacZoneModel.updated_at).where(EvacZoneModel.is_active == True)
+        )
+        versions = {row.id: row.updated_at for row in result}
+
+        stale = [
+            id for id, updated_at in versions.items()
+            if (id not in self.zones or self.zones[id].updated_at != updated_at)
+            and (id not in self._skipped or self._skipped[id] != updated_at)
+        ]
+        removed = (self.zones.keys() | self._skipped.keys()) - versions.keys()
+        if not stale and not removed:
+            return
+
+        for id in removed:
+            self.zones.pop(id, None)
+            self._skipped.pop(id, None)
+
+        if stale:
+            result = await db.execute(select(EvacZoneModel).where(EvacZoneModel.id.in_(stale)))
+            for zone in result.scalars():
+                self.zones.pop(zone.id, None)
+                self._skipped.pop(zone.id, None)
+
+                geometry = _parse_geometry(zone.geometry_geojson)
+                if geometry is None:
+                    self._skipped[zone.id] = zone.updated_at
+                    continue
+                self.zones[zone.id] = CachedZone(zone.id, zone.name, zone.updated_at, geometry)
+
+        self._tree_zones = list(self.zones.values())
+        self._tree = STRtree([zone.geometry for zone in self._tree_zones]) if self._tree_zones else None
+
+    def zones_containing(self, user_lat: float, user_lon: float) -> list[CachedZone]:
+        if self._tree is None:
+            return []
+
+        user_point = Point(user_lon, user_lat)
+        # the tree narrows it down to zones whose envelope covers the point
+        return [
+            self._tree_zones[i]
+            for i in self._tree.query(user_point)
+            if self._tree_zones[i].geometry.contains(user_point)
+        ]
+
+    def nearest_exit(self, user_lat: float, user_lon: float):
+        user_point = Point(user_lon, user_lat)
+
+        best_zone = None
+        best_exit_lat = None
+        best_exit_lon = None
+        best_dist = None
+
+        # membership is exact; only the exit of each zone comes from the per-cell cache
+        for zone in self.zones_containing(user_lat, user_lon):
+            exit_lat, exit_lon = self.exits.nearest_exit(zone, user_lat, user_lon)
+            dist = user_point.distance(Point(exit_lon, exit_lat))
+
+            if best_dist is None or dist < best_dist:
+                best_dist = dist
+                best_zone = zone
+                best_exit_lon = exit_lon
+                best_exit_lat = exit_lat
+
+        return best_zone, best_exit_lat, best_exit_lon
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+
+def _parse_geometry(geom_json: str | None):
+    if not geom_json:
+        return None
+    try:
+        geometry = shape(json.loads(geom_json))   # use polygon
+    except Exception:
+        return None
+    if not geometry.is_valid:
+        return None
+    return geometry
+
+
+# single instance shared by the scheduler and routes
+zone_cache = EvacZoneCache()
@@ -0,0 +1,155 @@
+import time
+from datetime import datetime
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import FireModel
+from schema.fireschema import FireSchema
+from config import settings
+from utils.geo import MinCoordinates
+from utils.spatial_index import GridIndex
+
+
+class FireTracker:
+    """
+    In-memory copy of the active fires, kept current with incremental queries.
+
+    Separate high-water marks are kept for updated_datetime (set by the source feed) and
+    inserted_at (set by the db), so a feed timestamp that runs ahead of the db clock can't hide new rows.
+    Deactivations show up as changed rows with is_active=False. Rows that are deleted or deactivated
+    without touching either timestamp are caught by comparing the active row count.
+    updated_datetime comes from the feed, so an update stamped older than the watermark (lagging source,
+    late replica) is invisible to the incremental query; every FIRE_RECONCILE_SECONDS the whole active
+    set is re-read instead, which bounds how long such a change can go unseen.
+    """
+
+    def __init__(self):
+        self.active: dict[str, FireSchema] = {}
+        # grid over the active fires' locations, for looking up the fires near a subscriber
+        self.index = GridIndex()
+        self.max_updated: datetime | None = None
+        self.max_inserted: datetime | None = None
+        self._env: str | None = None
+        # monotonic time of the last full read of the active fires
+        self._reconciled_at: float | None = None
+        # bumped by sync() whenever it saw the fire table change (any row, active or not)
+        self.version = 0
+
+    def reset(self):
+        self.active.clear()
+        self.index = GridIndex()
+        self.max_updated = None
+        self.max_inserted = None
+        self._reconciled_at = None
+        self.version += 1
+
+    def _advance(self, fire: FireModel):
+        if self.max_updated is None or fire.updated_datetime > self.max_updated:
+            self.max_updated = fire.updated_datetime
+        if fire.inserted_at is not None and (self.max_inserted is None or fire.inserted_at > self.max_inserted):
+            self.max_inserted = fire.inserted_at
+
+    def apply(self, fire: FireModel, advance: bool = True) -> FireSchema | None:
+        """
+        Fold one row into the active set. Returns its snapshot if it is active and changed.
+        Rows that arrive outside of sync() (e.g. pushed by NOTIFY) must pass advance=False:
+        moving the watermark past rows sync() hasn't read yet would skip them.
+        A row stamped older than the snapshot already held for its fire is ignored.
+        """
+        if advance:
+            self._advance(fire)
+
+        # a row older than the snapshot held (a replica read behind a NOTIFY-applied primary read) is stale
+        held = self.active.get(fire.id)
+        if held is not None and fire.updated_datetime < held.updated_datetime:
+            return None
+
+        if not fire.is_active:
+            self.forget(fire.id)
+            return None
+
+        snapshot = FireSchema.model_validate(fire, from_attributes=True)
+        if self.active.get(fire.id) == snapshot:
+            return None
+        self.active[fire.id] = snapshot
+        self.index.insert(fire.id, MinCoordinates(snapshot.latitude, snapshot.latitude, snapshot.longitude, snapshot.longitude))
+        return snapshot
+
+    async def sync(self, db: AsyncSession) -> tuple[list[FireSchema], list[str]]:
+        """
+        Pull the rows that changed since the last sync.
+        Returns (fires that became active or changed, ids of fires that are no longer active).
+        """
+        # the active db can be switched at runtime (/utils/change-db)
+        if self._env != settings.ENV:
+            self.reset()
+            self._env = settings.ENV
+
+        before = set(self.active)
+        before_marks = (self.max_updated, self.max_inserted)
+        changed: dict[str, FireSchema] = {}
+
+        full = (
+            self._reconciled_at is None
+            or (self.max_updated is None and self.max_inserted is None)
+            or time.monotonic() - self._reconciled_at >= settings.FIRE_RECONCILE_SECONDS
+        )
+        if full:
+            # first sync or periodic reconciliation: read everything that's active
+            result = await db.execute(select(FireModel).where(FireModel.is_active == True))
+        else:
+            # >= so rows sharing the watermark timestamp aren't missed; unchanged ones are filtered by apply()
+            conditions = []
+            if self.max_updated is not None:
+                conditions.append(FireModel.updated_datetime >= self.max_updated)
+            if self.max_inserted is not None:
+                conditions.append(FireModel.inserted_at >= self.max_inserted)
+            result = await db.execute(select(FireModel).where(or_(*conditions)))
+
+        seen = set()
+        for fire in result.scalars():
+            seen.add(fire.id)
+            snapshot = self.apply(fire)
+            if snapshot is not None:
+                changed[snapshot.id] = snapshot
+
+        if full:
+            # anything not read back is no longer active
+            for id in set(self.active) - seen:
+                self.forget(id)
+                changed.pop(id, None)
+            self._reconciled_at = time.monotonic()
+        else:
+            await self._check_active_count(db, changed)
+
+        removed = list(before - set(self.active))
+        if changed or removed or before_marks != (self.max_updated, self.max_inserted):
+            self.version += 1
+        return list(changed.values()), removed
+
+    async def _check_active_count(self, db: AsyncSession, changed: dict[str, FireSchema]):
+        # catch deletes/deactivations that didn't bump a timestamp
+        active_count = await db.scalar(
+            select(func.count()).select_from(FireModel).where(FireModel.is_active == True)
+        )
+        if active_count != len(self.active):
+            result = await db.execute(select(FireModel.id).where(FireModel.is_active == True))
+            active_ids = set(result.scalars())
+            for id in set(self.active) - active_ids:
+                self.forget(id)
+                changed.pop(id, None)
+
+            missing = active_ids - set(self.active)
+            if missing:
+                result = await db.execute(select(FireModel).where(FireModel.id.in_(missing)))
+                for fire in result.scalars():
+                    snapshot = self.apply(fire)
+                    if snapshot is not None:
+                        changed[snapshot.id] = snapshot
+
+    def forget(self, id: str) -> bool:
+        self.index.remove(id)
+        return self.active.pop(id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self.active)
@@ -1,5 +1,6 @@
+import numpy as np
 from geopy.point import Point
-from geopy.distance import geodesic, Distance
+from geopy.distance import geodesic
 
 class MinCoordinates:
     def __init__(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float):
@@ -26,4 +27,74 @@ def get_coordinates(latitude: float, longitude: float, radius: float) -> MinCoor
     min_lon = west.longitude
     max_lon = east.longitude
 
-    return MinCoordinates(min_lat, max_lat, min_lon, max_lon)
\ No newline at end of file
+    return MinCoordinates(min_lat, max_lat, min_lon, max_lon)
+
+
+# ===== VECTORIZED VERSIONS =====
+# get_coordinates above stays the scalar reference; these do the same math for many points in one numpy pass
+
+# WGS84 ellipsoid (same one geopy's geodesic uses)
+_WGS84_A = 6378137.0
+_WGS84_F = 1 / 298.257223563
+_WGS84_E2 = _WGS84_F * (2 - _WGS84_F)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _meridian_radius(phi: np.ndarray) -> np.ndarray:
+    # radius of curvature north/south
+    sin_phi = np.sin(phi)
+    return _WGS84_A * (1 - _WGS84_E2) / (1 - _WGS84_E2 * sin_phi * sin_phi) ** 1.5
+
+
+def _prime_vertical_radius(phi: np.ndarray) -> np.ndarray:
+    # radius of curvature east/west
+    sin_phi = np.sin(phi)
+    return _WGS84_A / np.sqrt(1 - _WGS84_E2 * sin_phi * sin_phi)
+
+
+def get_coordinates_batch(latitudes, longitudes, radii) -> np.ndarray:
+    """
+    Bounding boxes for many centers at once, as an (n, 4) array of [min_lat, max_lat, min_lon, max_lon].
+    North/south uses the meridian radius at the midpoint latitude and east/west the spherical formula
+    on the prime vertical radius; both agree with get_coordinates to within a few cm up to 100 km
+    (tests/test_geo.py), except for boxes that reach over a pole.
+    """
+    lat = np.asarray(latitudes, dtype=float)
+    lon = np.asarray(longitudes, dtype=float)
+    radius = np.asarray(radii, dtype=float)
+    phi = np.radians(lat)
+
+    first_guess = radius / _meridian_radius(phi)
+    north = radius / _meridian_radius(phi + first_guess / 2)
+    south = radius / _meridian_radius(phi - first_guess / 2)
+    east_west = np.arctan(np.tan(radius / _prime_vertical_radius(phi)) / np.cos(phi))
+
+    return np.column_stack((
+        lat - np.degrees(south),
+        lat + np.degrees(north),
+        lon - np.degrees(east_west),
+        lon + np.degrees(east_west),
+    ))
+
+
+def haversine_km(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """Great-circle distances (km) between matching pairs of points, shape (n,)."""
+    phi1 = np.radians(np.asarray(lats1, dtype=float))
+    phi2 = np.radians(np.asarray(lats2, dtype=float))
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lons2, dtype=float)) - np.radians(np.asarray(lons1, dtype=float))
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_km_matrix(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """Great-circle distances (km) between every point in set 1 and every point in set 2, shape (n1, n2)."""
+    phi1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    phi2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lons2, dtype=float))[None, :] - np.radians(np.asarray(lons1, dtype=float))[:, None]
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
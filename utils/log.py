@@ -0,0 +1,133 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+from config import settings
+from utils.colors import Color
+
+ROOT_LOGGER = "emberalert"
+
+LEVEL_COLORS = {
+    logging.DEBUG: Color.CYAN,
+    logging.INFO: Color.GREEN,
+    logging.WARNING: Color.YELLOW,
+    logging.ERROR: Color.RED,
+    logging.CRITICAL: Color.MAGENTA,
+}
+
+# attributes every LogRecord has; anything else was passed through extra= and is a structured field
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Colored one-line output for running locally: [LEVEL] Component: message key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        color = LEVEL_COLORS.get(record.levelno, "")
+        component = record.name.removeprefix(ROOT_LOGGER + ".")
+        line = f"{color}[{record.levelname}] {component}: {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        line += Color.RESET
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` DEBUG records per call site through every `interval_seconds`.
+    Per-connection debug lines would otherwise scale with the number of clients;
+    the next record let through reports how many were suppressed.
+    """
+
+    def __init__(self, limit: int, interval_seconds: float):
+        super().__init__()
+        self.limit = limit
+        self.interval_seconds = interval_seconds
+        # (logger, line) -> [window start, emitted, suppressed]
+        self._windows: dict[tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+
+        now = time.monotonic()
+        window = self._windows.setdefault((record.name, record.lineno), [now, 0, 0])
+        if now - window[0] >= self.interval_seconds:
+            window[0], window[1] = now, 0
+        if window[1] >= self.limit:
+            window[2] += 1
+            return False
+
+        window[1] += 1
+        if window[2]:
+            record.suppressed = window[2]
+            window[2] = 0
+        return True
+
+
+def setup_logging(stream=None):
+    """
+    Route every emberalert.* logger through a queue so callers never block on stdout (or `stream`);
+    a background thread formats and writes the records. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else ConsoleFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RateLimitFilter(settings.LOG_DEBUG_LIMIT, settings.LOG_DEBUG_INTERVAL_SECONDS))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    # flush whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,213 @@
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        ...
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self.samples()])
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        # an unlabelled counter is exported as 0 before its first increment
+        self._values: dict[tuple[str, ...], float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time from a callback (free on the hot path)."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> list[str]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# ===== APP METRICS =====
+# defined here so every module instruments the same objects; gauges get their callbacks where the state lives
+
+TICK_SECONDS = histogram("emberalert_check_fires_seconds", "Duration of a check_fires tick")
+TICK_OVERRUNS = counter("emberalert_check_fires_overruns_total", "Ticks that took longer than the interval or were skipped because one was still running")
+ACTIVE_FIRES = gauge("emberalert_active_fires", "Active fires tracked in memory")
+WS_CONNECTIONS = gauge("emberalert_ws_connections", "Websocket subscribers", ("scope",))
+ALERTS_SENT = counter("emberalert_alerts_sent_total", "Fire alerts delivered to subscribers (queued locally or handed to another worker)")
+WS_SEND_FAILURES = counter("emberalert_ws_send_failures_total", "Websocket messages that could not be sent", ("reason",))
+HTTP_REQUEST_SECONDS = histogram("emberalert_http_request_seconds", "HTTP request latency by route", ("method", "route", "status"))
+DB_QUERY_SECONDS = histogram("emberalert_db_query_seconds", "Database statement execution time", ("db",))
+DB_POOL = gauge("emberalert_db_pool_connections", "Database pool connections", ("db", "state"))
+WS_REAPED = counter("emberalert_ws_reaped_total", "Connections dropped by the heartbeat reaper", ("reason",))
+WS_RESUMES = counter("emberalert_ws_resumes_total", "Subscriber connects by how their alert stream resumed (replayed from the log or full resend)", ("result",))
+STARTUP_SECONDS = gauge("emberalert_startup_seconds", "Time to start serving, by phase (imports = loading the app, lifespan = startup work)", ("phase",))
+EXIT_CACHE_LOOKUPS = counter("emberalert_exit_cache_lookups_total", "Evac zone exit cache lookups", ("result",))
+EVAC_ZONE_LOOKUP_SECONDS = histogram("emberalert_evac_zone_lookup_seconds", "Nearest evac zone exit lookup time")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request, labelled by its route template (not the raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
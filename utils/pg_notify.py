@@ -0,0 +1,136 @@
+import asyncio
+from typing import Awaitable, Callable
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from utils.log import get_logger
+
+log = get_logger("pg_listener")
+
+# tables whose row changes are pushed to listeners
+NOTIFY_TABLES = ["fire_data", "evac_zones"]
+# transaction-level advisory lock taken while the triggers are installed
+NOTIFY_INSTALL_LOCK_KEY = 0x454D4E54
+
+
+def install_notify_triggers(engine: Engine, channel: str):
+    """
+    Create (or replace) the function that NOTIFYs `channel` with {"table", "op", "id"}, and the row
+    triggers calling it on the tables that don't have one yet. Serialized with an advisory lock so
+    workers migrating at once don't collide; existing triggers are left alone so a restart takes no
+    lock on the tables.
+    """
+    function = f"""
+        CREATE OR REPLACE FUNCTION emberalert_notify_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                '{channel}',
+                json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": NOTIFY_INSTALL_LOCK_KEY})
+        conn.execute(text(function))
+        for table in NOTIFY_TABLES:
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass(:table) AND tgname = :name"),
+                {"table": table, "name": f"{table}_notify"},
+            ).first()
+            if exists:
+                continue
+            conn.execute(text(
+                f"CREATE TRIGGER {table}_notify AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION emberalert_notify_change()"
+            ))
+            log.info("Installed notify trigger on %s", table)
+
+
+class PgListener:
+    """
+    Dedicated asyncpg connection that LISTENs on one channel and hands every payload to `on_notify`.
+    The connection is health-checked and re-opened when it drops; `on_reconnect` runs after a
+    re-open so callers can catch up on notifications sent while it was down.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str,
+        on_notify: Callable[[str], None],
+        on_reconnect: Callable[[], Awaitable[None]] | None = None,
+        retry_seconds: float = 5.0,
+        health_check_seconds: float = 30.0,
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_reconnect = on_reconnect
+        self.retry_seconds = retry_seconds
+        self.health_check_seconds = health_check_seconds
+        self.connection: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _callback(self, connection, pid, channel, payload):
+        try:
+            self.on_notify(payload)
+        except Exception as e:
+            log.error("Failed to handle notification on '%s' - %s: %s", channel, type(e).__name__, e)
+
+    async def _run(self):
+        connected_before = False
+        while True:
+            try:
+                self.connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                self.connection.add_termination_listener(lambda _: closed.set())
+                await self.connection.add_listener(self.channel, self._callback)
+                log.info("Listening on '%s'", self.channel)
+
+                if connected_before and self.on_reconnect is not None:
+                    await self.on_reconnect()
+                connected_before = True
+
+                # idle until the connection dies; ping it now and then to catch half-open sockets
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=self.health_check_seconds)
+                    except asyncio.TimeoutError:
+                        await self.connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                await self._close()
+                raise
+            except Exception as e:
+                log.error("Connection on '%s' lost - %s: %s", self.channel, type(e).__name__, e)
+
+            await self._close()
+            await asyncio.sleep(self.retry_seconds)
+
+    async def _close(self):
+        if self.connection is not None and not self.connection.is_closed():
+            try:
+                await self.connection.close(timeout=2)
+            except Exception:
+                self.connection.terminate()
+        self.connection = None
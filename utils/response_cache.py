@@ -0,0 +1,101 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+from config import settings
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, last_modified: datetime | None, headers: dict[str, str] | None = None):
+        self.body = body
+        # extra headers to send with the body (e.g. pagination cursors)
+        self.headers = headers or {}
+        # the extra headers are part of the representation (same page body, new next cursor != same response)
+        digest = hashlib.blake2b(body, digest_size=16)
+        digest.update(repr(sorted(self.headers.items())).encode())
+        self.etag = '"' + digest.hexdigest() + '"'
+        # http dates are UTC with no sub-second part
+        if last_modified and last_modified.tzinfo:
+            last_modified = last_modified.astimezone(timezone.utc)
+        self.last_modified = last_modified.replace(microsecond=0) if last_modified else None
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """
+    Encoded JSON bodies for read endpoints, keyed by path + query params + active db.
+    The whole cache is dropped by invalidate() when the underlying table changes; the ttl
+    bounds staleness for writes this process doesn't get told about.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+
+    def key(self, request: Request) -> tuple:
+        return (request.url.path, tuple(sorted(request.query_params.multi_items())), settings.ENV)
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, body: bytes, last_modified: datetime | None = None, headers: dict[str, str] | None = None) -> CachedResponse:
+        entry = CachedResponse(body, last_modified, headers)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match requires
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def conditional_response(request: Request, entry: CachedResponse) -> Response:
+    """Answer with 304 if the client already has this body, else send it with its validators."""
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.last_modified:
+        headers["Last-Modified"] = format_datetime(entry.last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, entry.etag):
+            return Response(status_code=304, headers=headers)
+    elif entry.last_modified and request.headers.get("if-modified-since"):
+        # only consulted when there's no If-None-Match
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+            if entry.last_modified <= since:
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# fire endpoints in router/server.py; invalidated by check_fires, NOTIFY and the test api writes
+fire_response_cache = ResponseCache(
+    ttl_seconds=settings.FIRE_RESPONSE_CACHE_TTL_SECONDS,
+    max_entries=settings.FIRE_RESPONSE_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,90 @@
+import math
+from utils.geo import MinCoordinates
+
+# size of a grid cell in degrees (~11 km north/south)
+DEFAULT_CELL_DEG = 0.1
+
+
+class GridIndex:
+    """
+    Bucket map from lat/lon grid cells to ids.
+    Every id is stored with its bounding box and registered in each cell the box overlaps,
+    so a point lookup only checks the ids bucketed in that point's cell.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells: dict[tuple[int, int], set[str]] = {}
+        self.boxes: dict[str, MinCoordinates] = {}
+        self._cells_by_id: dict[str, list[tuple[int, int]]] = {}
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def _cell_range(self, box: MinCoordinates) -> tuple[int, int, int, int]:
+        # box edges clamped to valid coordinates, so an oversized box can't reach past the poles/antimeridian
+        min_row, min_col = self._cell(max(box.min_lat, -90.0), max(box.min_lon, -180.0))
+        max_row, max_col = self._cell(min(box.max_lat, 90.0), min(box.max_lon, 180.0))
+        return min_row, min_col, max_row, max_col
+
+    def insert(self, id: str, box: MinCoordinates):
+        # drop the old cells first so a moved id doesn't linger in its previous buckets
+        self.remove(id)
+
+        min_row, min_col, max_row, max_col = self._cell_range(box)
+
+        keys = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                self.cells.setdefault((row, col), set()).add(id)
+                keys.append((row, col))
+
+        self.boxes[id] = box
+        self._cells_by_id[id] = keys
+
+    def remove(self, id: str):
+        keys = self._cells_by_id.pop(id, None)
+        if keys is None:
+            return
+
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket is None:
+                continue
+            bucket.discard(id)
+            if not bucket:
+                del self.cells[key]
+        self.boxes.pop(id, None)
+
+    def query_point(self, latitude: float, longitude: float) -> list[str]:
+        # ids whose bounding box contains the point
+        bucket = self.cells.get(self._cell(latitude, longitude))
+        if not bucket:
+            return []
+
+        hits = []
+        for id in bucket:
+            box = self.boxes[id]
+            if box.min_lat <= latitude <= box.max_lat and box.min_lon <= longitude <= box.max_lon:
+                hits.append(id)
+        return hits
+
+    def query_box(self, box: MinCoordinates) -> list[str]:
+        # ids whose bounding box overlaps `box`
+        min_row, min_col, max_row, max_col = self._cell_range(box)
+
+        hits = set()
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for id in self.cells.get((row, col), ()):
+                    other = self.boxes[id]
+                    if (other.min_lat <= box.max_lat and other.max_lat >= box.min_lat
+                            and other.min_lon <= box.max_lon and other.max_lon >= box.min_lon):
+                        hits.add(id)
+        return list(hits)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.boxes
+
+    def __len__(self) -> int:
+        return len(self.boxes)
@@ -0,0 +1,63 @@
+from typing import Callable
+from fastapi import Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import Select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+
+from utils.log import get_logger
+
+log = get_logger("streaming")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# rows fetched from the server-side cursor (and written to the client) per chunk
+STREAM_BATCH_ROWS = 500
+
+
+def wants_ndjson(request: Request, stream: bool = False) -> bool:
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def ndjson_response(stmt: Select, adapter: TypeAdapter, session_factory: Callable[[], AsyncSession]) -> StreamingResponse:
+    """
+    Stream the rows of `stmt` as newline-delimited JSON, one object per line.
+    Rows come from a server-side cursor STREAM_BATCH_ROWS at a time and are encoded as they
+    arrive, so memory stays flat however large the result is.
+    The stream opens its own session: route dependencies are closed before the body is sent.
+    The first batch is fetched before the response starts, so a query that fails outright gets the
+    usual 503/500; a failure in a later batch can only end the stream early.
+    """
+    db = session_factory()
+    try:
+        try:
+            result = await db.stream_scalars(stmt.execution_options(yield_per=STREAM_BATCH_ROWS))
+            partitions = result.partitions()
+            first = await anext(partitions, None)
+        except BaseException:
+            await db.close()
+            raise
+    except OperationalError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to the database.")
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected database error occurred.")
+
+    async def lines():
+        try:
+            rows = first
+            while rows is not None:
+                yield b"".join(
+                    adapter.dump_json(adapter.validate_python(row, from_attributes=True)) + b"\n"
+                    for row in rows
+                )
+                rows = await anext(partitions, None)
+        except Exception as e:
+            # headers are already sent, so all we can do is end the stream early
+            log.error("NDJSON stream aborted - %s: %s", type(e).__name__, e)
+        finally:
+            await db.close()
+
+    # closes the session too if the client goes away before the body is started
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, background=BackgroundTask(db.close))
@@ -0,0 +1,146 @@
+import json
+from typing import Mapping
+import msgpack
+from fastapi import WebSocket, WebSocketDisconnect
+
+from utils.alert_payload import FireAlertMessage, FireFragment
+
+FORMATS = ("json", "msgpack")
+
+# unacknowledged versions remembered per fire; an ack for anything older is ignored
+MAX_UNACKED_VERSIONS = 4
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+class WireProtocol:
+    """
+    How messages are framed for one websocket, chosen by the client when it connects.
+
+    format: "json" (text frames, the default) or "msgpack" (binary frames, same documents).
+    delta: fires the client has acknowledged are sent again as patches holding only the changed
+           fields, {"id", "v", "base", ...changed}, instead of in full. Full fires carry their
+           version as "v"; the client confirms what it stored with {"type": "ack", "fires": {id: v}}.
+    Compression is not chosen here: permessage-deflate is negotiated in the handshake and uvicorn
+    accepts it from any client that offers it (unless run with --ws-per-message-deflate false).
+    """
+
+    def __init__(self, format: str = "json", delta: bool = False, compression: str | None = None):
+        if format not in FORMATS:
+            raise ValueError(f"unsupported format '{format}', expected one of {', '.join(FORMATS)}")
+        self.format = format
+        self.delta = delta
+        self.compression = compression
+        # fire id -> version the client confirmed it holds
+        self.acked: dict[str, FireFragment] = {}
+        # fire id -> versions sent but not acknowledged yet (oldest first)
+        self.sent: dict[str, dict[str, FireFragment]] = {}
+
+    @classmethod
+    def negotiate(cls, websocket: WebSocket, hello: Mapping) -> tuple["WireProtocol", bool]:
+        """
+        Protocol from the query string (?format=msgpack&delta=1) and/or the first message's
+        "protocol" object, which wins. Also returns whether the client asked for anything,
+        in which case it expects a "protocol" message confirming the choice.
+        """
+        requested = {key: websocket.query_params[key] for key in ("format", "delta") if key in websocket.query_params}
+        options = hello.get("protocol") or {}
+        if not isinstance(options, Mapping):
+            raise ValueError("'protocol' must be an object")
+        requested.update(options)
+        offered = websocket.headers.get("sec-websocket-extensions", "")
+        protocol = cls(
+            format=str(requested.get("format", "json")).lower(),
+            delta=_flag(requested.get("delta", False)),
+            compression="permessage-deflate" if "permessage-deflate" in offered else None,
+        )
+        return protocol, bool(requested)
+
+    def describe(self) -> dict:
+        return {"type": "protocol", "format": self.format, "delta": self.delta, "compression": self.compression}
+
+    def encode(self, message) -> str | bytes:
+        """Frame a queued message: str is sent as-is (text), dicts and alerts in the negotiated format."""
+        if isinstance(message, str):
+            return message
+        if isinstance(message, FireAlertMessage):
+            if self.delta:
+                return self._encode_delta(message)
+            return message.encode_packed() if self.format == "msgpack" else message.encode()
+        if self.format == "msgpack":
+            return msgpack.packb(message)
+        return json.dumps(message, separators=(",", ":"), default=str)
+
+    def _encode_delta(self, message: FireAlertMessage) -> str | bytes:
+        packed = self.format == "msgpack"
+        fires = []
+        for fire_id, fire in message.fires.items():
+            self._remember(fire_id, fire)
+            base = self.acked.get(fire_id)
+            if base is None:
+                # full fire, pre-encoded once and shared with every other delta client
+                fires.append(fire.versioned_packed if packed else fire.versioned_json)
+                continue
+            patch = {"id": fire_id, "v": fire.version, "base": base.version}
+            if base.version != fire.version:
+                patch.update((key, value) for key, value in fire.fields.items() if base.fields.get(key) != value)
+            fires.append(msgpack.packb(patch) if packed else json.dumps(patch, separators=(",", ":")))
+
+        if packed:
+            packer = msgpack.Packer()
+            parts = [
+                packer.pack_map_header(3 + len(message.fields)),
+                packer.pack("type"), packer.pack(message.type),
+                packer.pack("delta"), packer.pack(True),
+                packer.pack("fires"), packer.pack_array_header(len(fires)),
+                *fires,
+            ]
+            for key, value in message.fields.items():
+                parts += [packer.pack(key), packer.pack(value)]
+            return b"".join(parts)
+
+        text = '{"type":"fire_alert","delta":true,"fires":[' + ",".join(fires) + "]"
+        if message.fields:
+            text += "," + json.dumps(message.fields, separators=(",", ":"))[1:-1]
+        return text + "}"
+
+    def _remember(self, fire_id: str, fire: FireFragment):
+        versions = self.sent.setdefault(fire_id, {})
+        versions.pop(fire.version, None)
+        versions[fire.version] = fire
+        while len(versions) > MAX_UNACKED_VERSIONS:
+            del versions[next(iter(versions))]
+
+    def ack(self, fires: Mapping[str, str]):
+        if not isinstance(fires, Mapping):
+            raise ValueError("'fires' must be an object of fire id to version")
+        for fire_id, version in fires.items():
+            fire = self.sent.get(fire_id, {}).get(version)
+            if fire is None:
+                continue
+            self.acked[fire_id] = fire
+            # older versions can no longer be acked usefully
+            versions = self.sent[fire_id]
+            while versions and next(iter(versions)) != version:
+                del versions[next(iter(versions))]
+            del versions[version]
+            if not versions:
+                del self.sent[fire_id]
+
+
+async def receive_message(websocket: WebSocket) -> dict:
+    """Next client message: JSON in a text frame or msgpack in a binary frame."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("text") is not None:
+        data = json.loads(message["text"])
+    else:
+        data = msgpack.unpackb(message["bytes"])
+    if not isinstance(data, dict):
+        raise ValueError("expected an object")
+    return data
@@ -1,61 +1,535 @@
-from fastapi import WebSocket, APIRouter, WebSocketDisconnect
-from fastapi.encoders import jsonable_encoder
+import asyncio
+import contextlib
+import time
+from uuid import uuid4
+from typing import Callable
+from collections import deque
+from fastapi import WebSocket, status
 from schema.fireschema import FireSchema
 from schema.userlocation import UserLocation
+from utils.geo import get_coordinates_batch, MinCoordinates
+from utils.spatial_index import GridIndex
+from utils.alert_state import AlertStateStore
+from utils.alert_log import AlertLog
+from utils.alert_payload import FireAlertMessage, FireFragments
+from utils.broker import Broker, InMemoryBroker
+from utils.wire import WireProtocol
+from utils.metrics import WS_SEND_FAILURES, WS_RESUMES, WS_REAPED
+from config import settings
+from utils.log import get_logger
+
+log = get_logger("ws")
+
+# bounding boxes are grown by this factor (spherical vs ellipsoidal distance differ by well under 0.5%)
+BOX_PADDING = 1.005
+
+
+class SendQueue:
+    """
+    Bounded outbound queue for one connection, drained by that connection's writer task.
+    Items are dicts, strings (sent as text as-is) or FireAlertMessages; the connection's WireProtocol frames them.
+    When full, "drop_oldest" drops the oldest plain message and "coalesce" first replaces a pending message
+    of the same type; neither drops an alert, a new one is merged into the newest pending alert instead.
+    "disconnect" drops the client.
+    """
+
+    def __init__(self, maxsize: int, policy: str):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items: deque = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, message) -> bool:
+        # returns False when the queue is full and the policy says to drop the client
+        if len(self.items) >= self.maxsize:
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "coalesce" and self._coalesce(message):
+                return True
+            WS_SEND_FAILURES.inc(reason="queue_overflow")
+            # a queued alert's fires are already recorded as sent, so an alert is never what gets dropped:
+            # an older plain message (ping, notice) goes first, otherwise alerts fold into the newest pending one
+            if not self._drop_oldest_plain():
+                if isinstance(message, FireAlertMessage):
+                    self._merge_alert(message)
+                return True
+
+        self.items.append(message)
+        self._ready.set()
+        return True
+
+    def _drop_oldest_plain(self) -> bool:
+        for i, pending in enumerate(self.items):
+            if not isinstance(pending, FireAlertMessage):
+                del self.items[i]
+                return True
+        return False
+
+    def _merge_alert(self, message: FireAlertMessage) -> bool:
+        for i in range(len(self.items) - 1, -1, -1):
+            if isinstance(self.items[i], FireAlertMessage):
+                self.items[i] = self.items[i].merge(message)
+                return True
+        return False
+
+    def _coalesce(self, message) -> bool:
+        # fold the message into the newest pending message of the same type
+        if isinstance(message, FireAlertMessage):
+            return self._merge_alert(message)
+        if not isinstance(message, dict):
+            return False
+
+        for i in range(len(self.items) - 1, -1, -1):
+            pending = self.items[i]
+            if not isinstance(pending, dict) or pending.get("type") != message.get("type"):
+                continue
+
+            if message.get("type") == "fire_alert":
+                # keep one entry per fire id, newer data wins
+                fires = {fire["id"]: fire for fire in pending.get("fires", [])}
+                fires.update({fire["id"]: fire for fire in message.get("fires", [])})
+                merged = {**pending, **message, "fires": list(fires.values())}
+                if "num_fires" in merged:
+                    merged["num_fires"] = len(merged["fires"])
+                self.items[i] = merged
+            else:
+                self.items[i] = message
+            return True
+        return False
+
+    async def get(self):
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.items.popleft()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
 
 class ConnectionManager:
-    def __init__(self):
+    """
+    Sockets held by this worker plus a directory of the subscribers held by other workers.
+    Presence (join/leave) is shared through the broker so whichever worker evaluates fires can match
+    every subscriber; alerts for a remote subscriber are published for its worker to deliver.
+    """
+
+    def __init__(self, broker: Broker | None = None):
+        self.worker_id = uuid4().hex
+        self.broker = broker or InMemoryBroker()
         self.active_connections: dict[str, dict] = {}
+        # subscribers connected to other workers: id -> (worker id, location)
+        self.remote: dict[str, tuple[str, UserLocation]] = {}
+        # grid of every connection's alert bounding box, used to match fires to subscribers
+        self.index = GridIndex()
+        # locations waiting to be (re)indexed; their bounding boxes are computed together in sync_index()
+        self._pending_index: dict[str, UserLocation] = {}
+        # ids that connected or moved since the last tick and need a full check against the active fires
+        self.moved: set[str] = set()
+        # which fire versions each device has already been alerted about
+        self.alert_state = AlertStateStore(
+            max_entries=settings.ALERT_STATE_MAX_ENTRIES,
+            ttl_seconds=settings.ALERT_STATE_TTL_SECONDS,
+        )
+        # numbered recent alerts per device, replayed to clients that reconnect with the last seq they saw
+        self.alert_log = AlertLog(
+            size=settings.ALERT_LOG_SIZE,
+            max_devices=settings.ALERT_LOG_MAX_DEVICES,
+            ttl_seconds=settings.ALERT_LOG_TTL_SECONDS,
+        )
+        # called with the id whenever a subscriber (local or remote) connects or moves
+        self.on_location_change: Callable[[str], None] | None = None
+        # keep references to fire-and-forget tasks so they aren't garbage collected
+        self._background_tasks: set[asyncio.Task] = set()
+        self._reaper: asyncio.Task | None = None
+        # moved locations waiting to be published, one join per device per LOCATION_DEBOUNCE_SECONDS window
+        self._pending_presence: dict[str, UserLocation] = {}
+        self._presence_task: asyncio.Task | None = None
 
-    async def add_connection(self, websocket: WebSocket, id: str, user_location: UserLocation):
-        self.active_connections[id] = {"socket": websocket, "location": user_location}
+    def _index_location(self, id: str, user_location: UserLocation):
+        self._pending_index[id] = user_location
 
-    async def send_message(self, id: str, message: str):
+    def sync_index(self):
+        """Index every location added or moved since the last call, with one vectorized bounding box pass."""
+        if not self._pending_index:
+            return
+
+        # take the batch first so a bad entry can't keep it (and every later tick) failing
+        ids = list(self._pending_index)
+        locations = list(self._pending_index.values())
+        self._pending_index.clear()
+        boxes = get_coordinates_batch(
+            latitudes=[location.latitude for location in locations],
+            longitudes=[location.longitude for location in locations],
+            # padded so the exact (spherical) radius check applied after the lookup never loses a fire
+            # that the ellipsoidal box clips at its edge
+            radii=[location.radius * BOX_PADDING for location in locations],
+        )
+        for id, (min_lat, max_lat, min_lon, max_lon) in zip(ids, boxes.tolist()):
+            try:
+                self.index.insert(id, MinCoordinates(min_lat, max_lat, min_lon, max_lon))
+            except (ValueError, OverflowError) as e:
+                # unusable location: this subscriber goes unmatched until it sends a valid one
+                self.index.remove(id)
+                log.error("Could not index location - %s: %s", type(e).__name__, e, extra={"device": id})
+
+    def location_of(self, id: str) -> UserLocation | None:
+        conn = self.active_connections.get(id)
+        if conn is not None:
+            # a connection being dropped gets no more evaluation work
+            return None if conn.get("closing") else conn["location"]
+        remote = self.remote.get(id)
+        return remote[1] if remote else None
+
+    def subscriber_ids(self) -> list[str]:
+        return [*self.active_connections, *self.remote]
+
+    async def add_connection(
+        self,
+        websocket: WebSocket,
+        id: str,
+        user_location: UserLocation,
+        protocol: WireProtocol | None = None,
+        last_seq: int | None = None,
+    ):
+        # a reconnect with the same id replaces the old connection and its writer
+        old = self.active_connections.get(id)
+        if old:
+            self._stop_writer(old)
+
+        conn = {
+            "socket": websocket,
+            "location": user_location,
+            "queue": SendQueue(maxsize=settings.WS_SEND_QUEUE_SIZE, policy=settings.WS_QUEUE_FULL_POLICY),
+            "protocol": protocol or WireProtocol(),
+            # monotonic time of the last frame from the client
+            "last_seen": time.monotonic(),
+            # set once the client answers a heartbeat; only those clients can be idle-reaped
+            "heartbeat": False,
+            # monotonic time the send in progress started (None when the writer is idle)
+            "sending_since": None,
+        }
+        conn["writer"] = asyncio.create_task(self._writer(id, conn))
+        self.active_connections[id] = conn
+        self.remote.pop(id, None)
+        self._pending_presence.pop(id, None)
+        self._mark_moved(id, user_location)
+        await self._publish_presence("join", id, user_location, connected=True, last_seq=last_seq)
+        if self.broker.is_leader:
+            # runs after the caller's own first messages (e.g. the protocol confirmation)
+            self._spawn(self._resume(id, last_seq))
+
+    async def _writer(self, id: str, conn: dict):
+        # drain the connection's queue so a slow client only ever delays itself
+        queue: SendQueue = conn["queue"]
+        protocol: WireProtocol = conn["protocol"]
+        try:
+            while True:
+                frame = protocol.encode(await queue.get())
+                conn["sending_since"] = time.monotonic()
+                if isinstance(frame, bytes):
+                    await conn["socket"].send_bytes(frame)
+                else:
+                    await conn["socket"].send_text(frame)
+                conn["sending_since"] = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            WS_SEND_FAILURES.inc(reason="send_error")
+            log.warning("Send failed, dropping connection - %s: %s", type(e).__name__, e, extra={"device": id})
+            if self.active_connections.get(id) is conn:
+                await self.disconnect(id)
+
+    def _stop_writer(self, conn: dict):
+        writer = conn.get("writer")
+        if writer and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def enqueue(self, id: str, message) -> bool:
+        """
+        Queue a message for a connection without waiting on the socket.
+        Returns False if the client is missing or was dropped because its queue is full.
+        """
         conn = self.active_connections.get(id)
         if not conn:
-            print(f"[WS] Tried to send message to missing ID: {id}")
+            log.debug("Tried to queue message for missing device", extra={"device": id})
+            return False
+
+        if conn.get("closing"):
+            return False
+        if conn["queue"].put(message):
+            return True
+
+        WS_SEND_FAILURES.inc(reason="queue_full")
+        log.warning("Send queue full, disconnecting slow client", extra={"device": id})
+        conn["closing"] = True
+        self._spawn(self._drop_client(id, conn, code=status.WS_1013_TRY_AGAIN_LATER))
+        return False
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _drop_client(self, id: str, conn: dict, code: int, forget: bool = False):
+        if self.active_connections.get(id) is conn:
+            await self.disconnect(id, forget=forget)
+        await self._close_socket(conn, code)
+
+    async def _close_socket(self, conn: dict, code: int):
+        try:
+            await conn["socket"].close(code=code)
+        except Exception:
+            pass
+
+    async def deliver(self, id: str, message: FireAlertMessage) -> bool:
+        """Number the alert in the device's log, then send it."""
+        if self.location_of(id) is None:
+            log.debug("Tried to deliver alert to missing device", extra={"device": id})
+            return False
+
+        seq = self.alert_log.append(id, message)
+        delivered = False
+        try:
+            delivered = await self._send_alert(id, message)
+        finally:
+            if not delivered:
+                self.alert_log.discard(id, seq)
+        return delivered
+
+    async def _send_alert(self, id: str, message: FireAlertMessage) -> bool:
+        # queue the alert on the local socket, or publish it for the worker holding the subscriber
+        if id in self.active_connections:
+            return self.enqueue(id, message)
+
+        remote = self.remote.get(id)
+        if remote is None:
+            return False
+        for part in message.split(self.broker.max_message_bytes):
+            # fires travel pre-encoded; the holding worker frames them in the client's protocol
+            await self.broker.publish("alerts", {"worker": remote[0], "id": id, **part.to_broker()})
+        return True
+
+    async def _resume(self, id: str, last_seq: int | None):
+        """
+        On the evaluating worker, when a device connects: replay the alerts it missed since `last_seq`.
+        A device that sends no seq, or one the log can't fill the gap from, starts over instead:
+        its dedup state is dropped so the next evaluation sends it every relevant fire again.
+        """
+        missed = None if last_seq is None else self.alert_log.since(id, last_seq)
+        if missed is None:
+            self.alert_state.forget_device(id)
+            WS_RESUMES.inc(result="full")
+            return
+
+        for _, message in missed:
+            await self._send_alert(id, message)
+        WS_RESUMES.inc(result="replayed")
+        log.debug("Resumed alert stream", extra={"device": id, "last_seq": last_seq, "replayed": len(missed)})
+
+    # ===== BROKER HANDLERS =====
+
+    async def _publish_presence(self, op: str, id: str, user_location: UserLocation | None = None, **extra):
+        message = {"origin": self.worker_id, "op": op, "id": id, **extra}
+        if user_location is not None:
+            message["location"] = user_location.model_dump()
+        try:
+            await self.broker.publish("presence", message)
+        except Exception as e:
+            log.error("Failed to publish presence '%s' - %s: %s", op, type(e).__name__, e, extra={"device": id})
+
+    def on_presence(self, message: dict):
+        origin = message.get("origin")
+        if origin == self.worker_id:
             return
-        await conn["socket"].send_text(message)
+
+        op, id = message.get("op"), message.get("id")
+        if op == "sync":
+            # a worker (re)started and needs the full directory
+            for local_id, conn in list(self.active_connections.items()):
+                self._spawn(self._publish_presence("join", local_id, conn["location"]))
+        elif op == "join":
+            conn = self.active_connections.pop(id, None)
+            if conn is not None:
+                # the device reconnected to another worker; this socket is stale
+                self._stop_writer(conn)
+                self._spawn(self._close_socket(conn, status.WS_1000_NORMAL_CLOSURE))
+            location = UserLocation(**message["location"])
+            self.remote[id] = (origin, location)
+            self._mark_moved(id, location)
+            if message.get("connected") and self.broker.is_leader:
+                self._spawn(self._resume(id, message.get("last_seq")))
+        elif op == "leave":
+            # only the worker currently holding the device can remove it
+            remote = self.remote.get(id)
+            if remote is not None and remote[0] == origin:
+                del self.remote[id]
+                self._forget(id, state=message.get("forget", False))
+
+    def on_alert(self, message: dict):
+        if message.get("worker") == self.worker_id and message.get("id") in self.active_connections:
+            self.enqueue(message["id"], FireAlertMessage.from_broker(message))
+
+    # ===== HEARTBEATS =====
+
+    def touch(self, id: str, pong: bool = False):
+        # the client sent a frame, so the connection is alive
+        conn = self.active_connections.get(id)
+        if conn:
+            conn["last_seen"] = time.monotonic()
+            if pong:
+                conn["heartbeat"] = True
+
+    def reap(self) -> int:
+        """
+        Drop connections whose send has been stuck past WS_SEND_TIMEOUT_SECONDS, and heartbeat clients
+        silent past WS_IDLE_TIMEOUT_SECONDS; ping the rest that have been quiet for an interval.
+        Dropped peers lose their dedup state and alert log too: they are most likely gone for good,
+        and if not they reconnect to a full resend.
+        """
+        now = time.monotonic()
+        reaped = 0
+        for id, conn in list(self.active_connections.items()):
+            if conn.get("closing"):
+                continue
+            if conn["sending_since"] is not None and now - conn["sending_since"] > settings.WS_SEND_TIMEOUT_SECONDS:
+                reason, code = "slow", status.WS_1013_TRY_AGAIN_LATER
+            elif conn["heartbeat"] and now - conn["last_seen"] > settings.WS_IDLE_TIMEOUT_SECONDS:
+                reason, code = "idle", status.WS_1001_GOING_AWAY
+            else:
+                if now - conn["last_seen"] >= settings.WS_PING_INTERVAL_SECONDS:
+                    self.enqueue(id, {"type": "ping"})
+                continue
+
+            WS_REAPED.inc(reason=reason)
+            log.info("Reaping dead connection", extra={"device": id, "reason": reason})
+            conn["closing"] = True
+            # the writer may be the thing that's stuck; stop it so closing doesn't wait behind it
+            self._stop_writer(conn)
+            self._spawn(self._drop_client(id, conn, code=code, forget=True))
+            reaped += 1
+        return reaped
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_SECONDS)
+            try:
+                self.reap()
+            except Exception as e:
+                log.error("Reaper failed - %s: %s", type(e).__name__, e)
+
+    def start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop_reaper(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+
+    async def start_broker(self):
+        self.broker.subscribe("presence", self.on_presence)
+        self.broker.subscribe("alerts", self.on_alert)
+        await self.broker.start()
+        await self._publish_presence("sync", "")
+
+    async def stop_broker(self):
+        if self._presence_task is not None:
+            self._presence_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._presence_task
+            self._presence_task = None
+        await self.broker.stop()
+
+    def take_moved(self) -> set[str]:
+        moved, self.moved = self.moved, set()
+        return moved
+
+    async def send_message(self, id: str, message: str):
+        if id not in self.active_connections:
+            log.debug("Tried to send message to missing device", extra={"device": id})
+            return
+        self.enqueue(id, message)
 
     async def update_location(self, id: str, user_location: UserLocation):
         conn = self.active_connections.get(id)
         if not conn:
-            print(f"[WS] Tried to update location for missing ID: {id}")
+            log.debug("Tried to update location for missing device", extra={"device": id})
             return
         conn["location"] = user_location
+        self._mark_moved(id, user_location)
+        self._pending_presence[id] = user_location
+        if self._presence_task is None or self._presence_task.done():
+            self._presence_task = asyncio.create_task(self._publish_pending_presence())
 
-    async def send_json_of_fires(self, id: str, fires: list[FireSchema]):
+    async def _publish_pending_presence(self):
+        # a client streaming gps updates costs the other workers one message per window, not one per update
+        while self._pending_presence:
+            await asyncio.sleep(settings.LOCATION_DEBOUNCE_SECONDS)
+            pending, self._pending_presence = self._pending_presence, {}
+            for id, user_location in pending.items():
+                if id in self.active_connections:
+                    await self._publish_presence("join", id, user_location)
+
+    def ack(self, id: str, fires: dict[str, str]):
+        # the client stored these fire versions; delta alerts can patch from them
         conn = self.active_connections.get(id)
-        if not conn:
-            print(f"[WS] Tried to send fires JSON to missing ID: {id}")
-            return
+        if conn:
+            conn["protocol"].ack(fires)
 
-        fires_json = [jsonable_encoder(fire) for fire in fires]
-        payload = {
-            "type": "fire_alert",
-            "num_fires": len(fires_json),
-            "fires": fires_json
-        }
+    async def send_json_of_fires(self, id: str, fires: list[FireSchema]):
+        if id not in self.active_connections:
+            log.debug("Tried to send fires JSON to missing device", extra={"device": id})
+            return
 
-        await conn["socket"].send_json(payload)
+        fragments = FireFragments()
+        message = FireAlertMessage({fire.id: fragments.get(fire) for fire in fires}, {"num_fires": len(fires)})
+        self.enqueue(id, message)
 
     async def send_json_message(self, id: str, message):
-        conn = self.active_connections.get(id)
-        if not conn:
-            print(f"[WS] Tried to send JSON message to missing ID: {id}")
+        if id not in self.active_connections:
+            log.debug("Tried to send JSON message to missing device", extra={"device": id})
             return
         if isinstance(message, dict):
-            await conn["socket"].send_json(message)
+            self.enqueue(id, message)
         else:
             payload = {
                 "type": "message",
                 "message": str(message),
             }
-            await conn["socket"].send_json(payload)
+            self.enqueue(id, payload)
+
+    async def disconnect(self, id: str, websocket: WebSocket | None = None, forget: bool = False):
+        # a socket that was already replaced by a reconnect with the same id must not remove the new one
+        conn = self.active_connections.get(id)
+        if conn and websocket is not None and conn["socket"] is not websocket:
+            log.debug("Ignored disconnect of replaced socket", extra={"device": id})
+            return
 
-    async def disconnect(self, id: str):
         if id in self.active_connections:
-            del self.active_connections[id]
-            print(f"[WS] Disconnected: {id}")
+            conn = self.active_connections.pop(id)
+            self._pending_presence.pop(id, None)
+            self._stop_writer(conn)
+            self._forget(id, state=forget)
+            await self._publish_presence("leave", id, forget=forget)
+            log.info("Disconnected", extra={"device": id})
         else:
-            print(f"[WS] Tried to disconnect missing ID: {id}")
+            log.debug("Tried to disconnect missing device", extra={"device": id})
+
+    def _mark_moved(self, id: str, user_location: UserLocation):
+        self._index_location(id, user_location)
+        self.moved.add(id)
+        if self.on_location_change is not None:
+            self.on_location_change(id)
+
+    def _forget(self, id: str, state: bool = False):
+        # dedup state and the alert log outlive the connection (until their ttl) so a reconnect can resume,
+        # unless `state` says the device is gone
+        self.index.remove(id)
+        self._pending_index.pop(id, None)
+        self.moved.discard(id)
+        if state:
+            self.alert_state.forget_device(id)
+            self.alert_log.forget_device(id)